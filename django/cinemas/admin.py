@@ -1,7 +1,30 @@
-from django.contrib import admin
+import statistics
+
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 
-from cinemas.models import CinemaProvider, ShowtimeSeats
+from cinemas.models import CinemaProvider, ScraperTask, Showtime, ShowtimeDiscovery, ShowtimeSeats
+from cinemas.refresh import get_showtimes_today
+from cinemas.tasks import start_profiled_scraper
+from cinemas.trends import (
+    RECENT_RUNS, REGRESSION_RATIO, get_chart_points, get_finished_tasks, get_providers_finished_tasks, get_slowdown
+)
+
+
+class CinemaProviderChangeList(ChangeList):
+
+    def get_results(self, request):
+        super().get_results(request)
+        # The runs of all cinema providers of the page are loaded with one query instead of one per row
+        providers_tasks = get_providers_finished_tasks(list(self.result_list))
+        for cinema_provider in self.result_list:
+            cinema_provider.finished_tasks = providers_tasks[cinema_provider.pk]
 
 
 @admin.register(CinemaProvider)
@@ -10,10 +33,155 @@ class CinemaProviderAdmin(admin.ModelAdmin):
         "name",
         "url",
         "is_available",
-        "scraper_status",
+        "prewarm_enabled",
+        "prewarmed_on",
+        "get_trend",
+    ]
+    list_editable = ("is_available", "prewarm_enabled")
+    readonly_fields = ["prewarmed_on"]
+    actions = ["profile_run"]
+
+    def get_urls(self):
+        return [
+            path("<path:object_id>/trends/", self.admin_site.admin_view(self.trends_view),
+                 name="cinemas_cinemaprovider_trends"),
+        ] + super().get_urls()
+
+    def get_changelist(self, request, **kwargs):
+        return CinemaProviderChangeList
+
+    def get_trend(self, object):
+        durations = [task.duration for task in object.finished_tasks]
+        if not durations:
+            return "-"
+        url = reverse("admin:cinemas_cinemaprovider_trends", args=[object.pk])
+        slowdown = get_slowdown(durations)
+        text = f"{statistics.median(durations[-RECENT_RUNS:]):.0f}s"
+        if slowdown is None:
+            return format_html("<a href='{}'>{}</a>", url, text)
+        color = "red" if slowdown >= REGRESSION_RATIO else "inherit"
+        return format_html("<a href='{}' style='color: {}'>{} ({:.1f}×)</a>", url, color, text, slowdown)
+    get_trend.short_description = "Run duration"
+
+    @admin.action(description="Profile a scraper run for today")
+    def profile_run(self, request, queryset):
+        today = get_showtimes_today()
+        for cinema_provider in queryset:
+            if start_profiled_scraper(str(cinema_provider.pk), today):
+                self.message_user(request, f"Started a profiled run of {cinema_provider.name}, the profile is saved "
+                                           f"on its scraper task")
+            else:
+                self.message_user(request, f"{cinema_provider.name} is already being scraped for today",
+                                  messages.WARNING)
+
+    def trends_view(self, request, object_id):
+        cinema_provider = get_object_or_404(CinemaProvider, pk=object_id)
+        tasks = get_finished_tasks(cinema_provider, 100)
+        durations = [task.duration for task in tasks]
+        slowdown = get_slowdown(durations)
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            original=cinema_provider,
+            title=f"Scraper runs of {cinema_provider.name}",
+            tasks=list(reversed(tasks)),
+            duration_points=get_chart_points(durations, 800, 200),
+            requests_points=get_chart_points(
+                [sum(task.stats.get("requests", {}).values()) for task in tasks], 800, 200
+            ),
+            max_duration=max(durations, default=0),
+            slowdown=slowdown,
+            regression=slowdown is not None and slowdown >= REGRESSION_RATIO,
+        )
+        return TemplateResponse(request, "admin/cinemas/cinemaprovider/trends.html", context)
+
+
+@admin.register(ScraperTask)
+class ScraperTaskAdmin(admin.ModelAdmin):
+    list_display = [
+        "cinema_provider",
+        "date_query",
+        "status",
+        "started_on",
+        "get_duration",
+        "get_requests",
+        "get_megabytes",
+        "get_rows",
+        "get_loop_blocked",
+        "get_profile",
+    ]
+    list_filter = ["cinema_provider", "status", "is_refresh"]
+    readonly_fields = ["started_on", "finished_on", "stats", "get_profile"]
+    # Profiles are not served from the public media location, see profile_view
+    exclude = ["completed_showtimes", "profile"]
+
+    def get_urls(self):
+        return [
+            path("<path:object_id>/profile/", self.admin_site.admin_view(self.profile_view),
+                 name="cinemas_scrapertask_profile"),
+        ] + super().get_urls()
+
+    def get_profile(self, object):
+        if not object.profile:
+            return "-"
+        url = reverse("admin:cinemas_scrapertask_profile", args=[object.pk])
+        return format_html("<a href='{}'>pstats</a>", url)
+    get_profile.short_description = "Profile"
+
+    def profile_view(self, request, object_id):
+        task = get_object_or_404(ScraperTask, pk=object_id)
+        if not task.profile:
+            raise Http404
+        return FileResponse(task.profile.open("rb"), as_attachment=True,
+                            filename=task.profile.name.split("/")[-1])
+
+    def get_duration(self, object):
+        return f"{object.duration:.0f}s" if object.duration is not None else "-"
+    get_duration.short_description = "Duration"
+
+    def get_requests(self, object):
+        return sum(object.stats.get("requests", {}).values())
+    get_requests.short_description = "Requests"
+
+    def get_megabytes(self, object):
+        return f"{object.stats.get('bytes', 0) / 1024 / 1024:.1f}"
+    get_megabytes.short_description = "MB"
+
+    def get_rows(self, object):
+        return object.stats.get("rows", "-")
+    get_rows.short_description = "Rows"
+
+    def get_loop_blocked(self, object):
+        loop = object.stats.get("loop", {})
+        return f"{loop['blocked']:.1f}s ({sum(loop['blocks'].values())})" if loop.get("blocks") else "-"
+    get_loop_blocked.short_description = "Loop blocked"
+
+
+@admin.register(Showtime)
+class ShowtimeAdmin(admin.ModelAdmin):
+    list_display = [
+        "movie",
+        "cinema",
+        "datetime",
+        "sold",
+        "sold_rate",
+        "refreshed_on",
+        "next_refresh_on",
+        "is_active",
+    ]
+    list_filter = ["cinema_provider", "is_active"]
+    readonly_fields = ["refreshed_on", "next_refresh_on"]
+
+
+@admin.register(ShowtimeDiscovery)
+class ShowtimeDiscoveryAdmin(admin.ModelAdmin):
+    list_display = [
+        "cinema_provider",
+        "date_query",
+        "showtimes_count",
+        "created_on",
     ]
-    list_editable = ("is_available",)
-    readonly_fields = ["scraper_status"]
+    list_filter = ["cinema_provider"]
 
 
 @admin.register(ShowtimeSeats)
@@ -0,0 +1,212 @@
+import json
+import logging
+import math
+import statistics
+import time
+import uuid
+from datetime import date
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from cinemas.constants import ScraperTaskStatus
+from cinemas.locks import ScraperLease, get_lease_key
+from cinemas.models import ScraperTask
+from common.redis import get_redis
+from common.tracing import get_trace_context
+
+# Admitted runs, run id -> "cinema provider pk|lease key|lease token"
+RUNNING_KEY = "scraper_admission:running"
+# Waiting run ids ordered by the time of the request
+QUEUE_KEY = "scraper_admission:queue"
+# Waiting runs, run id -> "cinema provider pk|lease key|lease token"
+META_KEY = "scraper_admission:meta"
+# Waiting runs, run id -> JSON run
+WAITING_KEY = "scraper_admission:waiting"
+# Waiting (cinema provider pk, date) pairs, "pk:date" -> run id
+PAIRS_KEY = "scraper_admission:pairs"
+RUN_DURATION_CACHE_KEY = "scraper_admission:run_duration"
+# Estimated duration of a run before any scraper task is finished in seconds
+DEFAULT_RUN_DURATION = 60
+
+# A run stays admitted while the lease of its first date is held by it, so the slots of finished runs and of dead
+# workers are freed without any cleanup. The waiting runs are admitted in the order of the requests, runs of the
+# cinema providers without a free slot are skipped and do not block the others.
+ADMIT_SCRIPT = """
+local max_runs = tonumber(ARGV[1])
+local max_provider_runs = tonumber(ARGV[2])
+local running = 0
+local provider_runs = {}
+local runs = redis.call("HGETALL", KEYS[1])
+for i = 1, #runs, 2 do
+    local provider, lease_key, token = string.match(runs[i + 1], "([^|]+)|([^|]+)|([^|]+)")
+    if redis.call("GET", lease_key) == token then
+        running = running + 1
+        provider_runs[provider] = (provider_runs[provider] or 0) + 1
+    else
+        redis.call("HDEL", KEYS[1], runs[i])
+    end
+end
+local admitted = {}
+for _, run_id in ipairs(redis.call("ZRANGE", KEYS[2], 0, -1)) do
+    if max_runs > 0 and running >= max_runs then
+        break
+    end
+    local meta = redis.call("HGET", KEYS[3], run_id)
+    if not meta then
+        redis.call("ZREM", KEYS[2], run_id)
+    else
+        local provider = string.match(meta, "([^|]+)|")
+        if max_provider_runs == 0 or (provider_runs[provider] or 0) < max_provider_runs then
+            redis.call("ZREM", KEYS[2], run_id)
+            redis.call("HDEL", KEYS[3], run_id)
+            redis.call("HSET", KEYS[1], run_id, meta)
+            running = running + 1
+            provider_runs[provider] = (provider_runs[provider] or 0) + 1
+            table.insert(admitted, redis.call("HGET", KEYS[4], run_id))
+            redis.call("HDEL", KEYS[4], run_id)
+        end
+    end
+end
+return admitted
+"""
+
+
+def get_pair_field(cinema_provider_pk, date_query: date) -> str:
+    return f"{cinema_provider_pk}:{date_query.isoformat()}"
+
+
+def load_run(run_json: str) -> list:
+    run = json.loads(run_json)
+    return [
+        run["cinema_provider_pk"],
+        [date.fromisoformat(d) for d in run["dates"]],
+        run["lease_tokens"],
+        run.get("trace_context"),
+    ]
+
+
+def enqueue_run(cinema_provider_pk: str, dates: List[date], lease_tokens: List[str]) -> str:
+    """
+    Puts the run of the leased dates into the admission queue, see admit_runs
+    """
+    run_id = uuid.uuid4().hex
+    run_json = json.dumps({
+        "cinema_provider_pk": cinema_provider_pk,
+        "dates": [date_query.isoformat() for date_query in dates],
+        "lease_tokens": lease_tokens,
+        # The run continues the trace of the request that started it, whichever process dispatches it
+        "trace_context": get_trace_context(),
+    })
+    pipe = get_redis().pipeline()
+    pipe.hset(META_KEY, run_id, f"{cinema_provider_pk}|{get_lease_key(cinema_provider_pk, dates[0])}|{lease_tokens[0]}")
+    pipe.hset(WAITING_KEY, run_id, run_json)
+    pipe.hset(PAIRS_KEY, mapping={get_pair_field(cinema_provider_pk, date_query): run_id for date_query in dates})
+    pipe.zadd(QUEUE_KEY, {run_id: time.time()})
+    pipe.execute()
+    return run_id
+
+
+def admit_runs() -> List[list]:
+    """
+    Admits the waiting runs while there are free slots, see SCRAPERS_MAX_RUNS and SCRAPERS_MAX_PROVIDER_RUNS.
+    Returns the admitted runs as [cinema provider pk, dates, lease tokens, trace context].
+    """
+    redis = get_redis()
+    admitted = redis.eval(
+        ADMIT_SCRIPT, 4, RUNNING_KEY, QUEUE_KEY, META_KEY, WAITING_KEY,
+        settings.SCRAPERS_MAX_RUNS, settings.SCRAPERS_MAX_PROVIDER_RUNS
+    )
+    runs = [load_run(run_json) for run_json in admitted if run_json]
+    fields = [get_pair_field(run[0], date_query) for run in runs for date_query in run[1]]
+    if fields:
+        redis.hdel(PAIRS_KEY, *fields)
+    return runs
+
+
+def renew_waiting_runs() -> int:
+    """
+    Keeps the leases of the waiting runs, runs whose leases were lost are dropped from the queue.
+    Returns the number of waiting runs.
+    """
+    redis = get_redis()
+    dropped = []
+    waiting = redis.hgetall(WAITING_KEY)
+    for run_id, run_json in waiting.items():
+        cinema_provider_pk, dates, lease_tokens, _ = load_run(run_json)
+        renewed = [
+            ScraperLease(cinema_provider_pk, date_query, lease_token).renew(settings.SCRAPERS_LEASE_PENDING_TTL)
+            for date_query, lease_token in zip(dates, lease_tokens)
+        ]
+        if not any(renewed):
+            logging.warning(f"Scraper run of {cinema_provider_pk} lost its leases in the admission queue")
+            dropped.append((run_id, [get_pair_field(cinema_provider_pk, date_query) for date_query in dates]))
+    if dropped:
+        pipe = redis.pipeline()
+        for run_id, fields in dropped:
+            pipe.zrem(QUEUE_KEY, run_id)
+            pipe.hdel(META_KEY, run_id)
+            pipe.hdel(WAITING_KEY, run_id)
+            pipe.hdel(PAIRS_KEY, *fields)
+        pipe.execute()
+    return len(waiting) - len(dropped)
+
+
+def get_run_duration() -> float:
+    """
+    Median duration of the recently finished scraper tasks in seconds
+    """
+    duration = cache.get(RUN_DURATION_CACHE_KEY)
+    if duration is None:
+        durations = [
+            (finished_on - started_on).total_seconds()
+            for started_on, finished_on in ScraperTask.objects.filter(
+                status=ScraperTaskStatus.FINISHED,
+                started_on__isnull=False,
+                finished_on__isnull=False
+            ).order_by("-finished_on").values_list("started_on", "finished_on")[:50]
+        ]
+        duration = statistics.median(durations) if durations else DEFAULT_RUN_DURATION
+        cache.set(RUN_DURATION_CACHE_KEY, duration, settings.SCRAPERS_CACHE_TIME)
+    return duration
+
+
+def get_queue_positions(pairs: List[Tuple[str, date]]) -> Dict[Tuple[str, date], dict]:
+    """
+    Returns the position in the admission queue and the estimated wait in seconds of every waiting pair
+    with a single Redis round trip
+    """
+    if not pairs:
+        return {}
+    pipe = get_redis().pipeline()
+    pipe.hmget(PAIRS_KEY, [get_pair_field(pk, date_query) for pk, date_query in pairs])
+    pipe.zrange(QUEUE_KEY, 0, -1)
+    pipe.hgetall(META_KEY)
+    run_ids, queue, metas = pipe.execute()
+    pair_run_ids = {pair: run_id for pair, run_id in zip(pairs, run_ids) if run_id}
+    if not pair_run_ids:
+        return {}
+
+    # Runs of a busy cinema provider wait for its own slots as well
+    run_positions = {}
+    provider_runs = {}
+    for position, run_id in enumerate(queue, start=1):
+        cinema_provider_pk = metas.get(run_id, b"").split(b"|")[0]
+        provider_runs[cinema_provider_pk] = provider_runs.get(cinema_provider_pk, 0) + 1
+        run_positions[run_id] = (position, provider_runs[cinema_provider_pk])
+
+    duration = get_run_duration()
+    positions = {}
+    for pair, run_id in pair_run_ids.items():
+        if run_id not in run_positions:
+            continue
+        position, provider_position = run_positions[run_id]
+        waves = 1
+        if settings.SCRAPERS_MAX_RUNS:
+            waves = max(waves, math.ceil(position / settings.SCRAPERS_MAX_RUNS))
+        if settings.SCRAPERS_MAX_PROVIDER_RUNS:
+            waves = max(waves, math.ceil(provider_position / settings.SCRAPERS_MAX_PROVIDER_RUNS))
+        positions[pair] = {"position": position, "wait": int(waves * duration)}
+    return positions
+
@@ -4,4 +4,18 @@ from django.utils.translation import gettext_lazy as _
 
 class ScraperStatus(TextChoices):
     AVAILABLE = "AV", _("Available")
+    QUEUED = "QU", _("Queued")
     IN_PROGRESS = "IP", _("In progress")
+    PARTIAL = "PR", _("Partial")
+
+
+class ScraperTaskStatus(TextChoices):
+    RUNNING = "RU", _("Running")
+    FINISHED = "FI", _("Finished")
+    FAILED = "FA", _("Failed")
+
+
+class Freshness(TextChoices):
+    FRESH = "FR", _("Fresh")
+    STALE = "ST", _("Stale")
+    EXPIRED = "EX", _("Expired")
@@ -0,0 +1,93 @@
+import logging
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from cinemas.models import Cinema, CinemaProvider, Movie, Showtime, ShowtimeDiscovery
+from common.models import Country
+
+
+class DiscoveredShowtime(NamedTuple):
+    external_id: str
+    country: str
+    cinema: Optional[str]
+    movie: str
+    language: str
+    datetime: datetime
+    payload: dict
+    experience: str = ""
+    cinema_room: str = ""
+    url: str = ""
+
+
+# Showtimes of every requested date
+DiscoverShowtimes = Callable[[List[date]], Dict[date, List[DiscoveredShowtime]]]
+
+
+def is_discovery_due(cinema_provider: CinemaProvider, date_query: date) -> bool:
+    last_discovery = ShowtimeDiscovery.objects.filter(
+        cinema_provider=cinema_provider,
+        date_query=date_query
+    ).order_by("created_on").last()
+    if not last_discovery:
+        return True
+    return timezone.now() - last_discovery.created_on >= timedelta(minutes=cinema_provider.discovery_interval)
+
+
+def get_cinema(country: Country, cinema_name: Optional[str]) -> Optional[Cinema]:
+    if not cinema_name:
+        return None
+    cinema, created = Cinema.objects.get_or_create(name=cinema_name, country=country)
+    return cinema
+
+
+def reconcile_showtimes(cinema_provider: CinemaProvider,
+                        date_query: date,
+                        discovered_showtimes: List[DiscoveredShowtime]) -> ShowtimeDiscovery:
+    with transaction.atomic():
+        external_ids = []
+        for discovered in discovered_showtimes:
+            country, created = Country.objects.get_or_create(name=discovered.country)
+            movie, created = Movie.objects.get_or_create(name=discovered.movie, language=discovered.language or "")
+            defaults = {
+                "country": country,
+                "movie": movie,
+                "date_query": date_query,
+                "datetime": discovered.datetime,
+                "payload": discovered.payload,
+                "experience": discovered.experience,
+                "cinema_room": discovered.cinema_room,
+                "url": discovered.url,
+                "is_active": True,
+            }
+            cinema = get_cinema(country, discovered.cinema)
+            if cinema:
+                defaults["cinema"] = cinema
+            Showtime.objects.update_or_create(
+                cinema_provider=cinema_provider,
+                external_id=discovered.external_id,
+                defaults=defaults
+            )
+            external_ids.append(discovered.external_id)
+
+        removed = Showtime.objects.filter(
+            cinema_provider=cinema_provider,
+            date_query=date_query,
+            is_active=True
+        ).exclude(external_id__in=external_ids).update(is_active=False)
+        discovery = ShowtimeDiscovery.objects.create(
+            cinema_provider=cinema_provider,
+            date_query=date_query,
+            showtimes_count=len(external_ids)
+        )
+    logging.info(f"Discovered {len(external_ids)} showtimes of {cinema_provider.name} for {date_query}, "
+                 f"{removed} showtimes removed")
+    return discovery
+
+
+def discover(cinema_provider: CinemaProvider, dates: List[date], discover_showtimes: DiscoverShowtimes):
+    discovered_showtimes = discover_showtimes(dates)
+    for date_query in dates:
+        reconcile_showtimes(cinema_provider, date_query, discovered_showtimes[date_query])
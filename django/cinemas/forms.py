@@ -1,10 +1,9 @@
-from datetime import date
-
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit, Layout, Field, Div, HTML, Fieldset, Button
 from django.forms import ModelForm, ModelMultipleChoiceField, CheckboxSelectMultiple, DateField, SelectDateWidget
 
 from cinemas.models import CinemaProvider
+from cinemas.refresh import get_showtimes_today
 
 
 class StartScraperForm(ModelForm):
@@ -13,7 +12,7 @@ class StartScraperForm(ModelForm):
         widget=CheckboxSelectMultiple
     )
     date = DateField(
-        initial=date.today,
+        initial=get_showtimes_today,
         widget=SelectDateWidget()
     )
 
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date
+from typing import Iterator, List, Optional, Set, Tuple
+
+from django.conf import settings
+
+from common.redis import get_redis
+
+# Only the owner of the lease can renew or release it
+RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+# The lease of a task waiting in the queue lives longer than the lease renewed by a running task
+TAKE_OVER_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] and redis.call("pttl", KEYS[1]) > tonumber(ARGV[2]) then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def get_lease_key(cinema_provider_pk, date_query: date) -> str:
+    return f"scraper_lease:{cinema_provider_pk}:{date_query.isoformat()}"
+
+
+def get_leased_pairs(pairs: List[Tuple[str, date]]) -> Set[Tuple[str, date]]:
+    if not pairs:
+        return set()
+    values = get_redis().mget([get_lease_key(pk, date_query) for pk, date_query in pairs])
+    return {pair for pair, value in zip(pairs, values) if value is not None}
+
+
+class ScraperLease:
+    """
+    Redis lease for scraping one cinema provider for one date.
+    Requests for a leased (cinema provider, date) pair are coalesced onto the running scraper,
+    different dates of the same cinema provider are scraped in parallel.
+    """
+
+    def __init__(self, cinema_provider_pk, date_query: date, token: Optional[str] = None):
+        self.key = get_lease_key(cinema_provider_pk, date_query)
+        self.token = token or uuid.uuid4().hex
+        self.held = False
+
+    def acquire(self, ttl: int = None) -> bool:
+        ttl = ttl or settings.SCRAPERS_LEASE_PENDING_TTL
+        return bool(get_redis().set(self.key, self.token, nx=True, px=ttl * 1000))
+
+    def renew(self, ttl: int = None) -> bool:
+        ttl = ttl or settings.SCRAPERS_LEASE_TTL
+        return bool(get_redis().eval(RENEW_SCRIPT, 1, self.key, self.token, ttl * 1000))
+
+    def take_over(self, ttl: int = None) -> bool:
+        """
+        Takes the lease for a redelivered task. The worker that received the task before may still be running it,
+        so the lease is taken only if no running task has renewed it or after it has expired.
+        The running worker renews it forever, so the redelivered task gives up after twice the lease lifetime.
+        """
+        ttl = ttl or settings.SCRAPERS_LEASE_TTL
+        deadline = time.monotonic() + ttl * 2
+        while True:
+            if self.acquire(ttl) or get_redis().eval(TAKE_OVER_SCRIPT, 1, self.key, self.token, ttl * 1000):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(1)
+
+    def release(self) -> bool:
+        return bool(get_redis().eval(RELEASE_SCRIPT, 1, self.key, self.token))
+
+    @contextmanager
+    def heartbeat(self, ttl: int = None, redelivered: bool = False) -> Iterator["ScraperLease"]:
+        ttl = ttl or settings.SCRAPERS_LEASE_TTL
+        stopped = threading.Event()
+
+        def renew_forever():
+            while not stopped.wait(ttl / 3):
+                try:
+                    if not self.renew(ttl):
+                        logging.warning(f"Scraper lease {self.key} was lost")
+                except Exception as e:
+                    logging.error(f"Scraper lease {self.key} renewal error {e}")
+
+        # A task without a lease (e.g. started from the shell) takes it over, a redelivered task waits until the worker
+        # that received it before stops renewing it
+        self.held = self.take_over(ttl) if redelivered else (self.renew(ttl) or self.acquire(ttl))
+        if not self.held:
+            logging.warning(f"Scraper lease {self.key} is held by another task")
+            yield self
+            return
+        thread = threading.Thread(target=renew_forever, name=f"lease-heartbeat-{self.key}", daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stopped.set()
+            thread.join()
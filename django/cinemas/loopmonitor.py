@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Set
+
+from django.conf import settings
+
+from cinemas.runstats import RunStats
+from common.metrics import SCRAPER_LOOP_BLOCKS, SCRAPER_LOOP_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def get_blocking_location(frame) -> str:
+    """
+    Innermost frame of the project code in the stack of the blocked loop, e.g. the scraper parsing a large page
+    """
+    stack = traceback.extract_stack(frame)
+    for frame_summary in reversed(stack):
+        if frame_summary.filename.startswith(str(settings.BASE_DIR)):
+            break
+    else:
+        frame_summary = stack[-1]
+    filename = Path(frame_summary.filename)
+    if filename.is_relative_to(settings.BASE_DIR):
+        filename = filename.relative_to(settings.BASE_DIR)
+    return f"{filename}:{frame_summary.lineno} {frame_summary.name}"
+
+
+class LoopMonitor:
+    """
+    Watches the event loop of the worker process from its own thread. Every SCRAPERS_LOOP_MONITOR_INTERVAL a callback
+    is scheduled in the loop, the time until it runs is the lag of the loop. A callback running longer than
+    SCRAPERS_LOOP_BLOCK_THRESHOLD is logged with the stack of the loop thread while it is still blocked.
+    The loop is shared, so the lag and the blocks are added to the statistics of every run in flight.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, loop_thread: threading.Thread):
+        self.loop = loop
+        self.loop_thread = loop_thread
+        self.runs: Set[RunStats] = set()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.monitor, name="scrapers-loop-monitor", daemon=True)
+        self.thread.start()
+
+    @contextmanager
+    def watch(self, stats: Optional[RunStats]) -> Iterator[None]:
+        if stats is None:
+            yield
+            return
+        with self.lock:
+            self.runs.add(stats)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.runs.discard(stats)
+
+    def monitor(self):
+        threshold = settings.SCRAPERS_LOOP_BLOCK_THRESHOLD
+        while self.loop_thread.is_alive() and not self.loop.is_closed():
+            time.sleep(settings.SCRAPERS_LOOP_MONITOR_INTERVAL)
+            called = threading.Event()
+            scheduled = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(called.set)
+            except RuntimeError:
+                # The loop was closed by the shutdown of the worker
+                return
+            location = None
+            if not called.wait(threshold):
+                if not self.loop.is_running():
+                    # The loop was stopped by the shutdown of the worker, its thread id may be reused by a new loop
+                    return
+                frame = sys._current_frames().get(self.loop_thread.ident)
+                if frame is not None:
+                    location = get_blocking_location(frame)
+                    logger.warning(
+                        f"Event loop blocked for more than {threshold}s at {location}\n"
+                        f"{''.join(traceback.format_stack(frame))}"
+                    )
+                while not called.wait(1):
+                    if not self.loop_thread.is_alive():
+                        return
+            self.record(time.monotonic() - scheduled, location)
+
+    def record(self, lag: float, location: Optional[str]):
+        SCRAPER_LOOP_LAG_SECONDS.observe(lag)
+        if location:
+            SCRAPER_LOOP_BLOCKS.inc()
+        with self.lock:
+            runs = list(self.runs)
+        for stats in runs:
+            stats.add_loop_lag(lag, location)
@@ -0,0 +1,56 @@
+import datetime
+import io
+import pstats
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from cinemas.models import CinemaProvider, ScraperTask
+from cinemas.refresh import get_showtimes_today
+from cinemas.tasks import scan_cinema_dates, start_profiled_scraper
+
+
+class Command(BaseCommand):
+    help = "Runs the scraper of the cinema provider under cProfile and tracemalloc and saves the profile on its task"
+
+    def add_arguments(self, parser):
+        parser.add_argument("cinema_provider", help="Name or id of the cinema provider")
+        parser.add_argument("--date", type=datetime.date.fromisoformat, help="Date to scrape, today by default")
+        parser.add_argument("--worker", action="store_true",
+                            help="Run on a celery worker instead of this process, like the admin action")
+        parser.add_argument("--top", type=int, default=20, help="Number of the slowest functions to show")
+
+    def handle(self, *args, **options):
+        cinema_provider = CinemaProvider.objects.filter(name=options["cinema_provider"]).first()
+        if cinema_provider is None:
+            try:
+                cinema_provider = CinemaProvider.objects.get(pk=options["cinema_provider"])
+            except (CinemaProvider.DoesNotExist, ValidationError):
+                raise CommandError(f"Cinema provider {options['cinema_provider']} does not exist")
+        date_query = options["date"] or get_showtimes_today()
+        cinema_provider_pk = str(cinema_provider.pk)
+
+        if options["worker"]:
+            if not start_profiled_scraper(cinema_provider_pk, date_query):
+                raise CommandError(f"{cinema_provider.name} is already being scraped for {date_query}")
+            self.stdout.write(f"Started a profiled run of {cinema_provider.name} for {date_query}")
+            return
+
+        if not scan_cinema_dates(cinema_provider_pk, [date_query], profile=True):
+            raise CommandError(f"{cinema_provider.name} is already being scraped for {date_query}")
+        task = ScraperTask.objects.filter(
+            cinema_provider=cinema_provider,
+            date_query=date_query
+        ).exclude(profile="").order_by("finished_on").last()
+        self.stdout.write(f"{cinema_provider.name} {date_query}: {task.get_status_display()} in {task.duration:.1f}s, "
+                          f"profile {task.profile.path}")
+
+        output = io.StringIO()
+        stats = pstats.Stats(task.profile.path, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(options["top"])
+        self.stdout.write(output.getvalue())
+        for stage, memory in task.stats.get("memory", {}).items():
+            self.stdout.write(f"{stage}: {memory['calls']} calls, {memory['growth_kb']} KB allocated, "
+                              f"{memory['traced_kb']} KB traced")
+            for line in memory["top"]:
+                self.stdout.write(f"    {line}")
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cinemas.registry import list_scraper_modules
+
+IMPORT_SCRIPT = "import django; django.setup(); import {module}"
+
+
+def parse_import_times(stderr: str) -> list:
+    """
+    Parses the "-X importtime" output into (cumulative microseconds, nesting level, module) tuples
+    """
+    import_times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_time, cumulative, module = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level
+        level = (len(module) - len(module.lstrip()) - 1) // 2
+        import_times.append((int(cumulative), level, module.strip()))
+    return import_times
+
+
+def get_dependencies(import_times: list, module: str) -> list:
+    """
+    Returns the modules imported directly by the module, they are reported right before it
+    """
+    index = max(i for i, (cumulative, level, name) in enumerate(import_times) if name == module)
+    module_level = import_times[index][1]
+    dependencies = []
+    for cumulative, level, name in reversed(import_times[:index]):
+        if level <= module_level:
+            break
+        if level == module_level + 1:
+            dependencies.append((cumulative, name))
+    return dependencies
+
+
+class Command(BaseCommand):
+    help = "Reports the import time of every scraper module and its heaviest dependencies"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=5, help="Number of the heaviest dependencies to show")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "config.settings"))
+        for module in list_scraper_modules():
+            # Every module is imported by a fresh interpreter, otherwise modules shared with the previous
+            # scrapers would be already imported
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT.format(module=module)],
+                cwd=settings.BASE_DIR,
+                env=env,
+                capture_output=True,
+                text=True
+            )
+            if result.returncode:
+                self.stderr.write(f"{module}: import error\n{result.stderr.splitlines()[-1]}")
+                continue
+
+            import_times = parse_import_times(result.stderr)
+            total = next(cumulative for cumulative, level, name in reversed(import_times) if name == module)
+            self.stdout.write(f"{module}: {total / 1000:.1f} ms")
+            for cumulative, name in sorted(get_dependencies(import_times, module), reverse=True)[:options["top"]]:
+                self.stdout.write(f"    {name}: {cumulative / 1000:.1f} ms")
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:31
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0009_alter_cinemaprovider_logo'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='cinemaprovider',
+            name='scraper_status',
+        ),
+    ]
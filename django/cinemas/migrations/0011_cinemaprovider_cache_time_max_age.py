@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0010_remove_cinemaprovider_scraper_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cinemaprovider',
+            name='cache_time',
+            field=models.PositiveIntegerField(blank=True, help_text='Seconds since the last scraper run during which its data is served without a refresh. SCRAPERS_CACHE_TIME by default', null=True),
+        ),
+        migrations.AddField(
+            model_name='cinemaprovider',
+            name='max_age',
+            field=models.PositiveIntegerField(blank=True, help_text='Seconds since the last scraper run after which its data is not served while a refresh is running. SCRAPERS_MAX_AGE by default', null=True),
+        ),
+    ]
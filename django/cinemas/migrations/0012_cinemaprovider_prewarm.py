@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0011_cinemaprovider_cache_time_max_age'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cinemaprovider',
+            name='prewarm_days',
+            field=models.PositiveSmallIntegerField(default=0, help_text='The scraper is prewarmed for today and this number of next days'),
+        ),
+        migrations.AddField(
+            model_name='cinemaprovider',
+            name='prewarm_enabled',
+            field=models.BooleanField(default=False, help_text='Run the scraper on schedule so that users find fresh data', verbose_name='prewarm?'),
+        ),
+        migrations.AddField(
+            model_name='cinemaprovider',
+            name='prewarm_interval',
+            field=models.PositiveIntegerField(default=60, help_text='Minutes between prewarm runs'),
+        ),
+        migrations.AddField(
+            model_name='cinemaprovider',
+            name='prewarmed_on',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
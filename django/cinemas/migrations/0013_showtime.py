@@ -0,0 +1,45 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0012_cinemaprovider_prewarm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Showtime',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('external_id', models.TextField(help_text='Showtime identifier on the cinema provider site')),
+                ('datetime', models.DateTimeField(verbose_name='Showtime datetime')),
+                ('payload', models.JSONField(blank=True, default=dict, help_text='Data the scraper needs to refresh seats of this showtime')),
+                ('sold', models.PositiveIntegerField(default=0, verbose_name='Sold seats on the last refresh')),
+                ('sold_rate', models.FloatField(default=0, verbose_name='Sold seats per hour')),
+                ('refreshed_on', models.DateTimeField(blank=True, null=True)),
+                ('next_refresh_on', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('cinema', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinemas.cinema')),
+                ('cinema_provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinemas.cinemaprovider')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinemas.movie')),
+            ],
+            options={
+                'ordering': ['datetime'],
+            },
+        ),
+        migrations.AddField(
+            model_name='showtimeseats',
+            name='showtime',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='cinemas.showtime'),
+        ),
+        migrations.AddConstraint(
+            model_name='showtime',
+            constraint=models.UniqueConstraint(fields=('cinema_provider', 'external_id'), name='unique_provider_showtime'),
+        ),
+    ]
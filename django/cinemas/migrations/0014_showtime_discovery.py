@@ -0,0 +1,82 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:36
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+def set_showtimes_date_query(apps, schema_editor):
+    Showtime = apps.get_model("cinemas", "Showtime")
+    for showtime in Showtime.objects.all():
+        showtime.date_query = showtime.datetime.date()
+        showtime.save(update_fields=["date_query"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0003_alter_error_options_error_source'),
+        ('cinemas', '0013_showtime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cinemaprovider',
+            name='discovery_interval',
+            field=models.PositiveIntegerField(default=360, help_text='Minutes between searches for new and removed showtimes. Scraper runs in between only refresh seats of known showtimes'),
+        ),
+        migrations.AddField(
+            model_name='showtime',
+            name='cinema_room',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Seats screen'),
+        ),
+        migrations.AddField(
+            model_name='showtime',
+            name='country',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='common.country'),
+        ),
+        migrations.AddField(
+            model_name='showtime',
+            name='date_query',
+            field=models.DateField(db_index=True, default=datetime.date(2023, 1, 1), help_text='The showtime was discovered for this date'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='showtime',
+            name='experience',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='showtime',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text='Inactive showtimes were removed from the cinema provider site'),
+        ),
+        migrations.AddField(
+            model_name='showtime',
+            name='url',
+            field=models.URLField(blank=True, max_length=2048, verbose_name='Showtime page url'),
+        ),
+        migrations.RunPython(set_showtimes_date_query, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='showtime',
+            name='cinema',
+            field=models.ForeignKey(blank=True, help_text='Some scrapers know the cinema only after receiving seats', null=True, on_delete=django.db.models.deletion.CASCADE, to='cinemas.cinema'),
+        ),
+        migrations.CreateModel(
+            name='ShowtimeDiscovery',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('date_query', models.DateField(help_text='Showtimes were discovered for this date')),
+                ('showtimes_count', models.PositiveIntegerField(default=0)),
+                ('cinema_provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cinemas.cinemaprovider')),
+            ],
+            options={
+                'verbose_name': 'Showtime Discovery',
+                'verbose_name_plural': 'Showtime Discoveries',
+                'ordering': ['-created_on'],
+            },
+        ),
+    ]
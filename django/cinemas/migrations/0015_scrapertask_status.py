@@ -0,0 +1,34 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+
+def set_tasks_finished(apps, schema_editor):
+    ScraperTask = apps.get_model("cinemas", "ScraperTask")
+    ScraperTask.objects.update(status="FI")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0014_showtime_discovery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapertask',
+            name='saved_count',
+            field=models.PositiveIntegerField(default=0, help_text='Showtimes whose seats are already saved'),
+        ),
+        migrations.AddField(
+            model_name='scrapertask',
+            name='showtimes_count',
+            field=models.PositiveIntegerField(default=0, help_text='Showtimes the scraper requests seats of'),
+        ),
+        migrations.AddField(
+            model_name='scrapertask',
+            name='status',
+            field=models.CharField(choices=[('RU', 'Running'), ('FI', 'Finished'), ('FA', 'Failed')], default='RU', max_length=2),
+        ),
+        migrations.RunPython(set_tasks_finished, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0015_scrapertask_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapertask',
+            name='completed_showtimes',
+            field=models.ManyToManyField(blank=True, help_text='Showtimes whose seats are already saved, skipped when the interrupted task is resumed', related_name='+', to='cinemas.showtime'),
+        ),
+    ]
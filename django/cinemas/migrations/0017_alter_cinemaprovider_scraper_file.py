@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0016_scrapertask_completed_showtimes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cinemaprovider',
+            name='scraper_file',
+            field=models.FilePathField(help_text='The file must be in the "scrapers" folder', match='.*\\.py$', path='scrapers'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0017_alter_cinemaprovider_scraper_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cinemaprovider',
+            name='shard_size',
+            field=models.PositiveIntegerField(default=0, help_text='Showtimes per celery task in the distributed mode, seats of a big cinema provider are requested by several workers at the same time. 0 runs the whole scraper in one task'),
+        ),
+    ]
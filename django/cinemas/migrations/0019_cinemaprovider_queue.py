@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0018_cinemaprovider_shard_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cinemaprovider',
+            name='queue',
+            field=models.CharField(blank=True, help_text='Celery queue of the scraper tasks, e.g. for workers dedicated to this cinema provider. Empty uses the SCRAPERS_QUEUE queue', max_length=64),
+        ),
+    ]
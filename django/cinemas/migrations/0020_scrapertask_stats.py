@@ -0,0 +1,28 @@
+# Generated by Django 4.2.5 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0019_cinemaprovider_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapertask',
+            name='finished_on',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scrapertask',
+            name='started_on',
+            field=models.DateTimeField(blank=True, help_text='Start of the last run of the task, a resumed task is started again', null=True),
+        ),
+        migrations.AddField(
+            model_name='scrapertask',
+            name='stats',
+            field=models.JSONField(blank=True, default=dict, help_text='Stage durations, requests by status, downloaded bytes, retries, written rows and peak memory of the run, see cinemas.runstats'),
+        ),
+    ]
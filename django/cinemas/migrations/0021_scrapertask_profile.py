@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0020_scrapertask_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapertask',
+            name='profile',
+            field=models.FileField(blank=True, help_text='cProfile stats of a profiled run, open with pstats, snakeviz or flameprof', upload_to='profiles/'),
+        ),
+    ]
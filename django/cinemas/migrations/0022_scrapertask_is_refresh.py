@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinemas', '0021_scrapertask_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapertask',
+            name='is_refresh',
+            field=models.BooleanField(default=False, help_text='Seats of the showtimes refreshed between the scraper runs, see cinemas.refresh'),
+        ),
+    ]
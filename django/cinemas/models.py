@@ -1,7 +1,9 @@
+from typing import Optional
+
 from common.models import TimestampedModel, Country
 from django.db import models
 
-from cinemas.constants import ScraperStatus
+from cinemas.constants import ScraperTaskStatus
 
 
 class CinemaProvider(TimestampedModel):
@@ -18,27 +20,65 @@ class CinemaProvider(TimestampedModel):
         default=False,
         verbose_name="available for users?"
     )
-    scraper_status = models.CharField(
-        max_length=2,
-        choices=ScraperStatus.choices,
-        null=False,
-        blank=False,
-        editable=False,
-        default=ScraperStatus.AVAILABLE,
-        verbose_name="Scraper status"
-    )
     scraper_file = models.FilePathField(
         blank=False,
         null=False,
         help_text='The file must be in the "scrapers" folder',
         path="scrapers",
         match=".*\.py$",
-        recursive=True
+        # Subfolders contain the scraper engine, not scrapers
+        recursive=False
     )
     logo = models.ImageField(
         blank=False,
         null=False,
     )
+    cache_time = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text="Seconds since the last scraper run during which its data is served without a refresh. "
+                  "SCRAPERS_CACHE_TIME by default"
+    )
+    max_age = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text="Seconds since the last scraper run after which its data is not served while a refresh is running. "
+                  "SCRAPERS_MAX_AGE by default"
+    )
+    prewarm_enabled = models.BooleanField(
+        default=False,
+        verbose_name="prewarm?",
+        help_text="Run the scraper on schedule so that users find fresh data"
+    )
+    prewarm_days = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="The scraper is prewarmed for today and this number of next days"
+    )
+    prewarm_interval = models.PositiveIntegerField(
+        default=60,
+        help_text="Minutes between prewarm runs"
+    )
+    prewarmed_on = models.DateTimeField(
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    discovery_interval = models.PositiveIntegerField(
+        default=60*6,
+        help_text="Minutes between searches for new and removed showtimes. Scraper runs in between only refresh seats "
+                  "of known showtimes"
+    )
+    shard_size = models.PositiveIntegerField(
+        default=0,
+        help_text="Showtimes per celery task in the distributed mode, seats of a big cinema provider are requested "
+                  "by several workers at the same time. 0 runs the whole scraper in one task"
+    )
+    queue = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Celery queue of the scraper tasks, e.g. for workers dedicated to this cinema provider. "
+                  "Empty uses the SCRAPERS_QUEUE queue"
+    )
 
     class Meta:
         verbose_name = "Cinema Provider"
@@ -61,6 +101,55 @@ class ScraperTask(TimestampedModel):
         null=False,
         help_text="Scraper looks for data for this date"
     )
+    status = models.CharField(
+        max_length=2,
+        choices=ScraperTaskStatus.choices,
+        default=ScraperTaskStatus.RUNNING,
+    )
+    showtimes_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Showtimes the scraper requests seats of"
+    )
+    saved_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Showtimes whose seats are already saved"
+    )
+    completed_showtimes = models.ManyToManyField(
+        "Showtime",
+        blank=True,
+        related_name="+",
+        help_text="Showtimes whose seats are already saved, skipped when the interrupted task is resumed"
+    )
+    started_on = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="Start of the last run of the task, a resumed task is started again"
+    )
+    finished_on = models.DateTimeField(
+        blank=True,
+        null=True
+    )
+    stats = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Stage durations, requests by status, downloaded bytes, retries, written rows and peak memory "
+                  "of the run, see cinemas.runstats"
+    )
+    profile = models.FileField(
+        upload_to="profiles/",
+        blank=True,
+        help_text="cProfile stats of a profiled run, open with pstats, snakeviz or flameprof"
+    )
+    is_refresh = models.BooleanField(
+        default=False,
+        help_text="Seats of the showtimes refreshed between the scraper runs, see cinemas.refresh"
+    )
+
+    @property
+    def duration(self) -> Optional[float]:
+        if not self.started_on or not self.finished_on:
+            return None
+        return (self.finished_on - self.started_on).total_seconds()
 
 
 class Cinema(TimestampedModel):
@@ -95,6 +184,121 @@ class Movie(TimestampedModel):
         return self.name
 
 
+class Showtime(TimestampedModel):
+    cinema_provider = models.ForeignKey(
+        CinemaProvider,
+        on_delete=models.CASCADE,
+        null=False,
+        blank=False
+    )
+    external_id = models.TextField(
+        blank=False,
+        null=False,
+        help_text="Showtime identifier on the cinema provider site"
+    )
+    country = models.ForeignKey(
+        Country,
+        on_delete=models.PROTECT,
+        blank=True,
+        null=True
+    )
+    cinema = models.ForeignKey(
+        Cinema,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        help_text="Some scrapers know the cinema only after receiving seats"
+    )
+    movie = models.ForeignKey(
+        Movie,
+        on_delete=models.CASCADE,
+        null=False,
+        blank=False,
+    )
+    date_query = models.DateField(
+        blank=False,
+        null=False,
+        db_index=True,
+        help_text="The showtime was discovered for this date"
+    )
+    datetime = models.DateTimeField(
+        null=False,
+        blank=False,
+        verbose_name="Showtime datetime"
+    )
+    url = models.URLField(
+        blank=True,
+        max_length=2048,
+        verbose_name="Showtime page url"
+    )
+    experience = models.CharField(
+        max_length=255,
+        blank=True
+    )
+    cinema_room = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name="Seats screen"
+    )
+    is_active = models.BooleanField(
+        default=True,
+        help_text="Inactive showtimes were removed from the cinema provider site"
+    )
+    payload = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Data the scraper needs to refresh seats of this showtime"
+    )
+    sold = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Sold seats on the last refresh"
+    )
+    sold_rate = models.FloatField(
+        default=0,
+        verbose_name="Sold seats per hour"
+    )
+    refreshed_on = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+    next_refresh_on = models.DateTimeField(
+        blank=True,
+        null=True,
+        db_index=True,
+    )
+
+    class Meta:
+        ordering = ["datetime"]
+        constraints = [
+            models.UniqueConstraint(fields=["cinema_provider", "external_id"], name="unique_provider_showtime"),
+        ]
+
+    def __str__(self):
+        return f"{self.movie.name} at {self.datetime.strftime('%d %B %H:%M')}"
+
+
+class ShowtimeDiscovery(TimestampedModel):
+    cinema_provider = models.ForeignKey(
+        CinemaProvider,
+        on_delete=models.CASCADE,
+        null=False,
+        blank=False
+    )
+    date_query = models.DateField(
+        blank=False,
+        null=False,
+        help_text="Showtimes were discovered for this date"
+    )
+    showtimes_count = models.PositiveIntegerField(
+        default=0
+    )
+
+    class Meta:
+        verbose_name = "Showtime Discovery"
+        verbose_name_plural = "Showtime Discoveries"
+        ordering = ["-created_on"]
+
+
 class ShowtimeSeats(TimestampedModel):
     task = models.ForeignKey(
         ScraperTask,
@@ -102,6 +306,12 @@ class ShowtimeSeats(TimestampedModel):
         null=False,
         blank=False,
     )
+    showtime = models.ForeignKey(
+        Showtime,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
     cinema = models.ForeignKey(
         Cinema,
         on_delete=models.CASCADE,
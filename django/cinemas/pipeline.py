@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import time
+from datetime import date
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from cinemas.constants import ScraperTaskStatus
+from cinemas.discovery import DiscoverShowtimes, discover, get_cinema, is_discovery_due
+from cinemas.models import ScraperTask, Showtime, ShowtimeSeats
+from cinemas.refresh import RefreshedSeats, observe_sold, postpone_refresh
+from cinemas.runstats import stage
+from cinemas.runtime import runtime
+from cinemas.status import set_task_progress
+from common.metrics import INGEST_BATCH_SECONDS, INGESTED_ROWS
+
+T = TypeVar("T")
+R = TypeVar("R")
+# Marks the end of the items and of the results of a stage
+STAGE_DONE = object()
+# Seats of the showtime, None if the scraper failed to receive them
+RefreshResult = Tuple[Showtime, Optional[List[RefreshedSeats]]]
+StreamShowtimes = Callable[[List[Showtime]], AsyncIterator[RefreshResult]]
+
+
+async def iter_stage(items: List[T], process: Callable[[T], Awaitable[R]], workers: int
+                     ) -> AsyncIterator[Tuple[T, R]]:
+    """
+    Processes the items by a fixed number of worker coroutines and yields every item together with its result
+    as soon as it is ready. The queues between the stages are bounded, so a slow consumer stops the workers
+    instead of piling up the results, and the items are taken by the workers in their order.
+    The results are yielded in the order of completion, not in the order of the items. Reordering them would hold
+    every result back behind the slowest item before it. The consumers do not depend on the order: the discovery
+    joins the showtimes by movie in the order of the movies, and every showtime is saved and checkpointed on its own.
+    An exception of the processing is raised by the iterator.
+    """
+    workers = max(min(workers, len(items)), 1)
+    inbox = asyncio.Queue(maxsize=workers)
+    outbox = asyncio.Queue(maxsize=workers)
+
+    async def produce():
+        for item in items:
+            await inbox.put(item)
+        for _ in range(workers):
+            await inbox.put(STAGE_DONE)
+
+    async def work():
+        try:
+            while (item := await inbox.get()) is not STAGE_DONE:
+                await outbox.put((item, await process(item)))
+        except Exception as e:
+            await outbox.put(e)
+        else:
+            await outbox.put(STAGE_DONE)
+
+    tasks = [asyncio.create_task(produce())] + [asyncio.create_task(work()) for _ in range(workers)]
+    try:
+        finished = 0
+        while finished < workers:
+            result = await outbox.get()
+            if result is STAGE_DONE:
+                finished += 1
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def iter_refreshed(showtimes: List[Showtime],
+                         refresh_showtime: Callable[[Showtime], Awaitable[Optional[List[RefreshedSeats]]]],
+                         limit: Optional[int] = None) -> AsyncIterator[RefreshResult]:
+    """
+    Yields every showtime together with its seats as soon as they are received.
+    At most `limit` showtimes are refreshed at the same time, they are started in the order of the list.
+    """
+    async def refresh(showtime: Showtime) -> Optional[List[RefreshedSeats]]:
+        try:
+            return await refresh_showtime(showtime)
+        except Exception as e:
+            logging.error(f"Seats of {showtime.external_id} showtime error {e}")
+            return None
+
+    # Without the limit requests of all showtimes interleave, and the first seats are received only at the end
+    async for result in iter_stage(showtimes, refresh, limit or len(showtimes)):
+        yield result
+
+
+async def collect_refreshed(results: AsyncIterator[RefreshResult]) -> Dict[UUID, Optional[List[RefreshedSeats]]]:
+    return {showtime.pk: seats async for showtime, seats in results}
+
+
+def save_seats(task: ScraperTask, showtime: Showtime, seats: List[RefreshedSeats]) -> int:
+    cinema_name = next((seats_item.cinema for seats_item in seats if seats_item.cinema), None)
+    if cinema_name and (not showtime.cinema or showtime.cinema.name != cinema_name):
+        showtime.cinema = get_cinema(showtime.country, cinema_name)
+    if not showtime.cinema:
+        logging.warning(f"Unknown cinema of {showtime.external_id} showtime")
+        return 0
+
+    ShowtimeSeats.objects.bulk_create([
+        ShowtimeSeats(
+            task=task,
+            showtime=showtime,
+            cinema=showtime.cinema,
+            movie=showtime.movie,
+            datetime=showtime.datetime,
+            url=showtime.url,
+            experience=seats_item.experience if seats_item.experience is not None else showtime.experience,
+            cinema_room=seats_item.cinema_room if seats_item.cinema_room is not None else showtime.cinema_room,
+            all=seats_item.all,
+            sold=seats_item.sold,
+            price=seats_item.price,
+            area=seats_item.area,
+        )
+        for seats_item in seats
+    ])
+    observe_sold(showtime, sum(seats_item.sold for seats_item in seats))
+    # Only the observation is saved, the discovery updates the showtime at the same time
+    showtime.save(update_fields=["cinema", "sold", "sold_rate", "refreshed_on", "next_refresh_on", "updated_on"])
+    return len(seats)
+
+
+def save_refreshed(cinema_provider_pk: str, showtimes: List[Showtime],
+                   results: Dict[UUID, Optional[List[RefreshedSeats]]]) -> int:
+    """
+    Saves the refreshed seats into a refresh task of every date, so the rows of the scraper runs keep the seats
+    observed by them
+    """
+    tasks = {}
+    rows = 0
+    with transaction.atomic():
+        for showtime in showtimes:
+            seats = results.get(showtime.pk)
+            if seats is None:
+                postpone_refresh(showtime)
+                continue
+            if showtime.date_query not in tasks:
+                tasks[showtime.date_query] = ScraperTask.objects.create(
+                    cinema_provider_id=cinema_provider_pk,
+                    date_query=showtime.date_query,
+                    status=ScraperTaskStatus.FINISHED,
+                    is_refresh=True
+                )
+            task = tasks[showtime.date_query]
+            task.showtimes_count += 1
+            task.saved_count += 1
+            rows += save_seats(task, showtime, seats)
+        for task in tasks.values():
+            task.finished_on = timezone.now()
+            task.save(update_fields=["showtimes_count", "saved_count", "finished_on", "updated_on"])
+    return rows
+
+
+def save_batch(task: ScraperTask, batch: List[RefreshResult]):
+    rows = 0
+    with INGEST_BATCH_SECONDS.time(), transaction.atomic():
+        for showtime, seats in batch:
+            rows += save_seats(task, showtime, seats)
+        # Checkpoint of the task, the seats and the completed showtimes are saved in one transaction
+        task.completed_showtimes.add(*[showtime for showtime, seats in batch])
+        # Shards of the distributed mode save seats of the same task at the same time
+        ScraperTask.objects.filter(pk=task.pk).update(
+            saved_count=F("saved_count") + len(batch),
+            updated_on=timezone.now()
+        )
+    INGESTED_ROWS.labels(task.cinema_provider.name).inc(rows)
+    task.refresh_from_db(fields=["saved_count", "showtimes_count", "updated_on"])
+    set_task_progress(task)
+
+
+def save_batches(tasks: Dict[date, ScraperTask], batch: List[RefreshResult]):
+    # Seats of every showtime are saved into the task of its date
+    tasks_batches = {}
+    for showtime, seats in batch:
+        tasks_batches.setdefault(showtime.date_query, []).append((showtime, seats))
+    for date_query, task_batch in tasks_batches.items():
+        save_batch(tasks[date_query], task_batch)
+
+
+async def persist_refreshed(tasks: Dict[date, ScraperTask], results: AsyncIterator[RefreshResult]) -> int:
+    """
+    Saves the received seats in micro-batches while the scraper keeps receiving the next ones,
+    so the seats saved so far can be downloaded before the scraper finishes.
+    The seats arrive in the order their requests complete. A batch holds whole showtimes, and every showtime is saved
+    together with its checkpoint, so a resumed run skips exactly the saved showtimes in any order.
+    """
+    batch = []
+    saved_on = time.monotonic()
+    try:
+        async for showtime, seats in results:
+            if seats is None:
+                logging.warning(f"Seats of {showtime.external_id} showtime were not received")
+            else:
+                batch.append((showtime, seats))
+            if batch and (len(batch) >= settings.SCRAPERS_SAVE_BATCH_SIZE or
+                          time.monotonic() - saved_on >= settings.SCRAPERS_SAVE_INTERVAL):
+                with stage("persist"):
+                    await sync_to_async(save_batches)(tasks, batch)
+                batch = []
+                saved_on = time.monotonic()
+        if batch:
+            with stage("persist"):
+                await sync_to_async(save_batches)(tasks, batch)
+    finally:
+        # The database connection of the sync_to_async thread outlives the celery task otherwise
+        await sync_to_async(close_old_connections)()
+    return sum(task.saved_count for task in tasks.values())
+
+
+def discover_dates(tasks: List[ScraperTask], discover_showtimes: DiscoverShowtimes) -> List[ScraperTask]:
+    """
+    Discovers showtimes of all due dates with one scraper run and returns the tasks that can request seats
+    """
+    cinema_provider = tasks[0].cinema_provider
+    dates = [task.date_query for task in tasks if is_discovery_due(cinema_provider, task.date_query)]
+    if not dates:
+        return tasks
+    try:
+        discover(cinema_provider, dates, discover_showtimes)
+    except Exception as e:
+        # Seats of the known showtimes are still refreshed, the discovery is retried by the next run
+        known_dates = set(Showtime.objects.filter(
+            cinema_provider=cinema_provider,
+            date_query__in=dates
+        ).values_list("date_query", flat=True))
+        failed_tasks = [task for task in tasks if task.date_query in dates and task.date_query not in known_dates]
+        if len(failed_tasks) == len(tasks):
+            raise
+        logging.error(f"Showtime discovery error of {cinema_provider.name} {e}")
+        for task in failed_tasks:
+            task.status = ScraperTaskStatus.FAILED
+            task.save(update_fields=["status", "updated_on"])
+        return [task for task in tasks if task not in failed_tasks]
+    return tasks
+
+
+def get_pending_showtimes(tasks: Dict[date, ScraperTask], showtime_pks: Optional[List[str]] = None) -> List[Showtime]:
+    """
+    Returns the active showtimes of the task dates whose seats are not saved yet
+    """
+    cinema_provider_pk = next(iter(tasks.values())).cinema_provider_id
+    completed_showtimes = ScraperTask.completed_showtimes.through.objects.filter(scrapertask__in=tasks.values())
+    showtimes = Showtime.objects.filter(
+        cinema_provider_id=cinema_provider_pk,
+        date_query__in=tasks,
+        is_active=True
+    ).exclude(pk__in=completed_showtimes.values("showtime"))
+    if showtime_pks is not None:
+        showtimes = showtimes.filter(pk__in=showtime_pks)
+    return list(showtimes.select_related("country", "cinema", "movie"))
+
+
+def count_showtimes(tasks: Dict[date, ScraperTask], showtimes: List[Showtime]):
+    for task in tasks.values():
+        if task.saved_count:
+            logging.info(f"Skip {task.saved_count} completed showtimes of the resumed task {task.id}")
+        task.showtimes_count = task.saved_count + sum(showtime.date_query == task.date_query for showtime in showtimes)
+        task.save(update_fields=["showtimes_count", "updated_on"])
+        set_task_progress(task)
+
+
+def stream_to_tasks(tasks: Dict[date, ScraperTask], showtimes: List[Showtime], stream_showtimes: StreamShowtimes):
+    cinema_provider = next(iter(tasks.values())).cinema_provider
+    logging.info(f"Start receiving seats of {len(showtimes)} showtimes for {cinema_provider.name} "
+                 f"{', '.join(str(date_query) for date_query in tasks)}")
+    # Includes the persist stage, the seats are received while a batch is saved
+    with stage("seats"):
+        runtime.run(persist_refreshed(tasks, stream_showtimes(showtimes)))
+
+
+def scrape_showtimes(tasks: List[ScraperTask],
+                     discover_showtimes: DiscoverShowtimes,
+                     stream_showtimes: StreamShowtimes):
+    """
+    Runs the scraper for the dates of the tasks in two tiers. Discovery of movies and showtimes runs only once
+    in the cinema provider discovery interval, other runs request seats of the known showtimes only.
+    All dates share one discovery and one seats run, the seats are saved into the task of every date.
+    """
+    with stage("discovery"):
+        tasks = {task.date_query: task for task in discover_dates(tasks, discover_showtimes)}
+    showtimes = get_pending_showtimes(tasks)
+    count_showtimes(tasks, showtimes)
+    stream_to_tasks(tasks, showtimes, stream_showtimes)
@@ -0,0 +1,115 @@
+import cProfile
+import marshal
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from cinemas.models import ScraperTask
+from cinemas.runstats import current_profile
+
+# Allocations of the profiler itself and of the imports are not reported
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+# Profiled runs of the worker process tracing the allocations, see trace_allocations
+tracing_lock = threading.Lock()
+tracing_runs = 0
+tracing_started = False
+
+
+class RunProfile:
+    """
+    cProfile stats of a whole scraper run and the memory allocated by its stages. The profiler sees only
+    the thread that enabled it, so runtime.run executes the coroutines of a profiled run in that thread.
+    """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.memory: Dict[str, dict] = {}
+
+    def take_snapshot(self) -> tracemalloc.Snapshot:
+        # Snapshots are slow to take and compare, they are kept out of the profile
+        self.profiler.disable()
+        try:
+            return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        finally:
+            self.profiler.enable()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Compares the tracemalloc snapshots before and after the stage. Stages called many times, e.g. persist,
+        sum their growth and keep the top allocations of the call that grew the most.
+        """
+        before = self.take_snapshot()
+        try:
+            yield
+        finally:
+            after = self.take_snapshot()
+            self.profiler.disable()
+            diff = after.compare_to(before, "lineno")
+            self.profiler.enable()
+            growth = sum(stat.size_diff for stat in diff)
+            memory = self.memory.setdefault(name, {"calls": 0, "growth_kb": 0, "max_growth_kb": 0, "top": []})
+            memory["calls"] += 1
+            memory["growth_kb"] += growth // 1024
+            memory["traced_kb"] = tracemalloc.get_traced_memory()[0] // 1024
+            if not memory["top"] or growth // 1024 > memory["max_growth_kb"]:
+                memory["max_growth_kb"] = growth // 1024
+                memory["top"] = [str(stat) for stat in diff[:settings.SCRAPERS_PROFILE_TOP_ALLOCATIONS]]
+
+    def save(self, tasks: List[ScraperTask]):
+        """
+        Saves the stats in the pstats format into the profile file shared by the tasks of the run
+        """
+        self.profiler.create_stats()
+        task = tasks[0]
+        name = f"{task.cinema_provider.name}-{timezone.now():%Y%m%d-%H%M%S}.pstats"
+        task.profile.save(name, ContentFile(marshal.dumps(self.profiler.stats)), save=False)
+        for other_task in tasks[1:]:
+            other_task.profile.name = task.profile.name
+        ScraperTask.objects.filter(pk__in=[task.pk for task in tasks]).update(profile=task.profile.name)
+
+
+@contextmanager
+def trace_allocations() -> Iterator[None]:
+    """
+    tracemalloc is global to the process, so it is started by the first profiled run of the worker and stopped
+    after the last one. The snapshots of runs profiled at the same time also include the allocations of each other.
+    """
+    global tracing_runs, tracing_started
+    with tracing_lock:
+        if not tracing_runs:
+            # The worker may already trace the allocations, e.g. with PYTHONTRACEMALLOC
+            tracing_started = not tracemalloc.is_tracing()
+            if tracing_started:
+                tracemalloc.start()
+        tracing_runs += 1
+    try:
+        yield
+    finally:
+        with tracing_lock:
+            tracing_runs -= 1
+            if not tracing_runs and tracing_started:
+                tracemalloc.stop()
+
+
+@contextmanager
+def profile_run() -> Iterator[RunProfile]:
+    profile = RunProfile()
+    token = current_profile.set(profile)
+    with trace_allocations():
+        profile.profiler.enable()
+        try:
+            yield profile
+        finally:
+            profile.profiler.disable()
+            current_profile.reset(token)
@@ -0,0 +1,133 @@
+import datetime as dt
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+
+from cinemas.models import ScraperTask, Showtime, ShowtimeSeats
+
+# (time until the showtime starts, refresh interval). Seats are sold fastest right before the showtime
+REFRESH_TIERS = [
+    (timedelta(hours=1), timedelta(minutes=5)),
+    (timedelta(hours=3), timedelta(minutes=15)),
+    (timedelta(hours=12), timedelta(hours=1)),
+    (timedelta(days=2), timedelta(hours=3)),
+]
+MAX_REFRESH_INTERVAL = timedelta(hours=12)
+MIN_REFRESH_INTERVAL = timedelta(minutes=5)
+# Sold seats per hour after which a showtime is refreshed twice as often
+FAST_SOLD_RATE = 10
+# Weight of the last observation in the sold rate moving average
+SOLD_RATE_WEIGHT = 0.5
+
+
+class RefreshedSeats(NamedTuple):
+    area: str
+    all: int
+    sold: int
+    price: float
+    # Scrapers that know these values only from the seats page set them, otherwise the showtime values are used
+    experience: Optional[str] = None
+    cinema_room: Optional[str] = None
+    cinema: Optional[str] = None
+
+
+def get_showtimes_now() -> datetime:
+    # Scrapers store the local showtime time of the cinema provider without a time zone
+    local_now = timezone.now().astimezone(ZoneInfo(settings.SHOWTIMES_TIME_ZONE))
+    return local_now.replace(tzinfo=dt.timezone.utc)
+
+
+def get_showtimes_today() -> dt.date:
+    # The date of a scraper run is the local date of the cinema provider, not the date in TIME_ZONE
+    return get_showtimes_now().date()
+
+
+def get_refresh_interval(starts_in: timedelta, sold_rate: float, refreshed: bool) -> Optional[timedelta]:
+    if starts_in <= timedelta(0):
+        return None
+
+    interval = MAX_REFRESH_INTERVAL
+    for tier_starts_in, tier_interval in REFRESH_TIERS:
+        if starts_in <= tier_starts_in:
+            interval = tier_interval
+            break
+    if sold_rate >= FAST_SOLD_RATE:
+        interval /= 2
+    elif refreshed and sold_rate == 0:
+        interval *= 2
+    return min(max(interval, MIN_REFRESH_INTERVAL), MAX_REFRESH_INTERVAL)
+
+
+def observe_sold(showtime: Showtime, sold: int):
+    now = timezone.now()
+    if showtime.refreshed_on:
+        hours = (now - showtime.refreshed_on).total_seconds() / 3600
+        if hours > 0:
+            rate = max(sold - showtime.sold, 0) / hours
+            showtime.sold_rate = SOLD_RATE_WEIGHT * rate + (1 - SOLD_RATE_WEIGHT) * showtime.sold_rate
+    schedule_refresh(showtime, refreshed=showtime.refreshed_on is not None)
+    showtime.sold = sold
+    showtime.refreshed_on = now
+
+
+def schedule_refresh(showtime: Showtime, refreshed: bool = True):
+    starts_in = _as_aware(showtime.datetime) - get_showtimes_now()
+    interval = get_refresh_interval(starts_in, showtime.sold_rate, refreshed)
+    showtime.next_refresh_on = timezone.now() + interval if interval else None
+
+
+def postpone_refresh(showtime: Showtime):
+    # The scraper failed to refresh the showtime, try again on the next interval
+    schedule_refresh(showtime)
+    showtime.save(update_fields=["next_refresh_on", "updated_on"])
+
+
+def get_current_seats(task: ScraperTask) -> List[ShowtimeSeats]:
+    """
+    Returns the seats of the scraper task with the seats of every showtime refreshed after it, until the next
+    scraper run of the date, replaced by the last refresh. Every row keeps the time it was scraped on.
+    """
+    seats = list(ShowtimeSeats.objects.filter(task=task))
+    if task.is_refresh:
+        return seats
+    refreshes = ShowtimeSeats.objects.filter(
+        task__cinema_provider_id=task.cinema_provider_id,
+        task__date_query=task.date_query,
+        task__is_refresh=True,
+        task__created_on__gt=task.created_on
+    )
+    next_task = ScraperTask.objects.filter(
+        cinema_provider_id=task.cinema_provider_id,
+        date_query=task.date_query,
+        is_refresh=False,
+        created_on__gt=task.created_on
+    ).order_by("created_on").first()
+    if next_task:
+        refreshes = refreshes.filter(task__created_on__lt=next_task.created_on)
+
+    refreshed = {}
+    for row in refreshes.order_by("task__created_on"):
+        last_rows = refreshed.get(row.showtime_id)
+        if last_rows and last_rows[0].task_id == row.task_id:
+            last_rows.append(row)
+        else:
+            refreshed[row.showtime_id] = [row]
+    current_seats = []
+    for row in seats:
+        if row.showtime_id not in refreshed:
+            current_seats.append(row)
+        elif refreshed[row.showtime_id]:
+            current_seats.extend(refreshed[row.showtime_id])
+            refreshed[row.showtime_id] = []
+    for rows in refreshed.values():
+        current_seats.extend(rows)
+    return current_seats
+
+
+def _as_aware(value: datetime) -> datetime:
+    if timezone.is_naive(value):
+        return value.replace(tzinfo=dt.timezone.utc)
+    return value
@@ -0,0 +1,47 @@
+import importlib
+import logging
+import time
+from types import ModuleType
+from typing import Dict, List
+
+from django.conf import settings
+
+from cinemas.models import CinemaProvider
+
+SCRAPERS_DIR = "scrapers"
+
+
+def get_scraper_module_str(scraper_file: str) -> str:
+    return scraper_file.replace("/", ".")[0:-3]
+
+
+def list_scraper_modules() -> List[str]:
+    # Same files as the scraper_file choices of the cinema provider
+    scrapers_path = settings.BASE_DIR / SCRAPERS_DIR
+    return sorted(
+        get_scraper_module_str(f"{SCRAPERS_DIR}/{path.name}")
+        for path in scrapers_path.glob("*.py")
+    )
+
+
+def get_scraper_module(cinema_provider: CinemaProvider) -> ModuleType:
+    # Modules preloaded at the worker boot are taken from sys.modules without any import work
+    return importlib.import_module(get_scraper_module_str(cinema_provider.scraper_file))
+
+
+def preload_scrapers() -> Dict[str, float]:
+    """
+    Imports all scraper modules, so that the first scraper task after a worker restart does not pay the import time.
+    Returns the import time of every module in seconds.
+    """
+    import_times = {}
+    for module_str in list_scraper_modules():
+        started = time.perf_counter()
+        try:
+            importlib.import_module(module_str)
+        except Exception as e:
+            logging.error(f"Scraper {module_str} preload error {e}")
+            continue
+        import_times[module_str] = time.perf_counter() - started
+    logging.info(f"Preloaded {len(import_times)} scrapers in {sum(import_times.values()):.2f}s")
+    return import_times
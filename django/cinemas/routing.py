@@ -0,0 +1,38 @@
+from typing import Optional
+
+from django.conf import settings
+
+from cinemas.status import get_provider
+
+# Tasks whose first argument is the cinema provider pk
+SCRAPER_TASKS = {
+    "cinemas.tasks.scan_cinema",
+    "cinemas.tasks.scan_cinema_dates",
+    "cinemas.tasks.scan_shard",
+    "cinemas.tasks.refresh_showtimes",
+}
+INGEST_TASKS = {
+    "cinemas.tasks.finish_shards",
+}
+
+
+def get_scraper_queue(cinema_provider_pk: str) -> str:
+    # The provider cache is reset when the cinema provider is saved, see cinemas.signals
+    provider = get_provider(cinema_provider_pk)
+    return provider and provider["queue"] or settings.SCRAPERS_QUEUE
+
+
+def route_task(name: str, args: tuple, kwargs: dict, options: dict, task=None, **kw) -> Optional[dict]:
+    """
+    Celery router, see CELERY_TASK_ROUTES. Other tasks go to the default queue
+    """
+    if name in SCRAPER_TASKS:
+        cinema_provider_pk = args[0] if args else kwargs["cinema_provider_pk"]
+        return {"queue": get_scraper_queue(cinema_provider_pk)}
+    if name == "cinemas.tasks.scan_cinemas":
+        # Runs of one task are grouped by the queue, see start_scrapers
+        runs = args[0] if args else kwargs["runs"]
+        return {"queue": get_scraper_queue(runs[0][0])}
+    if name in INGEST_TASKS:
+        return {"queue": settings.SCRAPERS_INGEST_QUEUE}
+    return None
@@ -0,0 +1,157 @@
+import contextlib
+import resource
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from common.tracing import start_span
+
+# Statistics of the scraper run executed by the current celery task, see collect_run_stats
+current_run_stats: ContextVar[Optional["RunStats"]] = ContextVar("current_run_stats", default=None)
+# Profile of the scraper run started by the profile_scraper command or the admin action, see cinemas.profiling
+current_profile: ContextVar = ContextVar("current_profile", default=None)
+
+
+def get_peak_rss() -> int:
+    # Peak resident memory of the worker process since its start in MB, ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+
+def get_rss() -> int:
+    # Current resident memory of the worker process in MB, /proc/self/statm counts it in pages
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() // 1024 // 1024
+    except OSError:
+        return get_peak_rss()
+
+
+class RunStats:
+    """
+    Performance statistics of one scraper run saved on its ScraperTasks. The stages are timed by the pipeline,
+    the requests are counted by the clients of the scraper engine.
+    """
+
+    def __init__(self):
+        # All ScraperTasks of a run save the same statistics, the trends count them once by this id
+        self.run = uuid.uuid4().hex
+        self.stages: Dict[str, float] = {}
+        # Requests by the response status or the error name
+        self.requests: Dict[str, int] = {}
+        self.bytes = 0
+        self.retries = 0
+        # Lag of the event loop measured by the loop monitor, and the code that blocked it by its location
+        self.loop_samples = 0
+        self.loop_lag = 0.0
+        self.loop_max_lag = 0.0
+        self.loop_blocks: Dict[str, int] = {}
+        self.loop_blocked = 0.0
+        # Resident memory of the worker process at the start of the run and at the end of every stage in MB.
+        # Runs of the threads pool share the process, so other runs in flight are included
+        self.rss_started = get_rss()
+        self.rss: Dict[str, int] = {}
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0) + seconds
+
+    def add_requests(self, statuses: Dict[str, int], downloaded: int, retries: int):
+        for status, count in statuses.items():
+            self.requests[status] = self.requests.get(status, 0) + count
+        self.bytes += downloaded
+        self.retries += retries
+
+    def add_rss(self, name: str, rss: int):
+        self.rss[name] = max(self.rss.get(name, 0), rss)
+
+    def add_loop_lag(self, lag: float, location: Optional[str] = None):
+        self.loop_samples += 1
+        self.loop_lag += lag
+        self.loop_max_lag = max(self.loop_max_lag, lag)
+        if location:
+            self.loop_blocks[location] = self.loop_blocks.get(location, 0) + 1
+            self.loop_blocked += lag
+
+    def as_dict(self) -> dict:
+        return {
+            "run": self.run,
+            "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "loop": {
+                "samples": self.loop_samples,
+                "lag": round(self.loop_lag, 3),
+                "max_lag": round(self.loop_max_lag, 3),
+                "blocked": round(self.loop_blocked, 3),
+                "blocks": self.loop_blocks,
+            },
+            "rss": {
+                "started": self.rss_started,
+                "stages": self.rss,
+                "finished": get_rss(),
+            },
+            "peak_rss": get_peak_rss(),
+        }
+
+
+def merge_run_stats(runs_stats: List[dict]) -> dict:
+    """
+    Statistics of the distributed run from the statistics of the discovery and of every shard.
+    Stage durations are summed, so they are the work time of all workers together.
+    """
+    stats = RunStats()
+    peak_rss = 0
+    rss_finished = 0
+    if runs_stats:
+        # The first statistics are of the discovery, which starts the run
+        stats.run = runs_stats[0].get("run", stats.run)
+        stats.rss_started = runs_stats[0].get("rss", {}).get("started", stats.rss_started)
+    for run_stats in runs_stats:
+        for name, seconds in run_stats.get("stages", {}).items():
+            stats.add_stage(name, seconds)
+        stats.add_requests(run_stats.get("requests", {}), run_stats.get("bytes", 0), run_stats.get("retries", 0))
+        peak_rss = max(peak_rss, run_stats.get("peak_rss", 0))
+        rss = run_stats.get("rss", {})
+        rss_finished = max(rss_finished, rss.get("finished", 0))
+        for name, stage_rss in rss.get("stages", {}).items():
+            stats.add_rss(name, stage_rss)
+        loop = run_stats.get("loop", {})
+        stats.loop_samples += loop.get("samples", 0)
+        stats.loop_lag += loop.get("lag", 0)
+        stats.loop_max_lag = max(stats.loop_max_lag, loop.get("max_lag", 0))
+        stats.loop_blocked += loop.get("blocked", 0)
+        for location, count in loop.get("blocks", {}).items():
+            stats.loop_blocks[location] = stats.loop_blocks.get(location, 0) + count
+    merged = stats.as_dict()
+    merged["rss"]["finished"] = rss_finished
+    return dict(merged, peak_rss=peak_rss)
+
+
+@contextmanager
+def collect_run_stats() -> Iterator[RunStats]:
+    stats = RunStats()
+    token = current_run_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_run_stats.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Adds the time of the block to the stage of the current scraper run, if any, and traces it.
+    The memory allocated by the stage of a profiled run is compared by tracemalloc snapshots.
+    """
+    profile = current_profile.get()
+    started = time.monotonic()
+    try:
+        with start_span(name), profile.stage(name) if profile else contextlib.nullcontext():
+            yield
+    finally:
+        stats = current_run_stats.get()
+        if stats is not None:
+            stats.add_stage(name, time.monotonic() - started)
+            stats.add_rss(name, get_rss())
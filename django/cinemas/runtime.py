@@ -0,0 +1,111 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from django.conf import settings
+
+from cinemas.loopmonitor import LoopMonitor
+from cinemas.runstats import current_profile, current_run_stats
+
+T = TypeVar("T")
+
+
+async def run_in_context(coro: Awaitable[T], context: contextvars.Context) -> T:
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+class WorkerRuntime:
+    """
+    Event loop of the worker process. The loop runs in a daemon thread for the whole life of the process,
+    so consecutive scraper runs reuse the loop together with the connections and DNS cache bound to it.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.monitor: Optional[LoopMonitor] = None
+        self.pid: Optional[int] = None
+        self.lock = threading.Lock()
+        self.shutdown_callbacks: List[Callable[[], Awaitable]] = []
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        if settings.SCRAPERS_UVLOOP:
+            try:
+                import uvloop
+                return uvloop.new_event_loop()
+            except ImportError:
+                logging.warning("uvloop is not installed, the default event loop is used")
+        return asyncio.new_event_loop()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            # The thread of the loop does not survive the fork of a pool process, the child starts its own loop
+            if self.loop is None or self.pid != os.getpid() or not self.thread.is_alive():
+                self.loop = self.new_event_loop()
+                self.pid = os.getpid()
+                self.shutdown_callbacks = []
+                self.thread = threading.Thread(target=self.loop.run_forever, name="scrapers-loop", daemon=True)
+                self.thread.start()
+                self.monitor = None
+                if settings.SCRAPERS_LOOP_MONITOR:
+                    self.monitor = LoopMonitor(self.loop, self.thread)
+                    self.monitor.start()
+                logging.info(f"Started {type(self.loop).__module__} event loop of the worker process {self.pid}")
+            return self.loop
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """
+        Runs the coroutine in the worker loop and waits for its result, replaces asyncio.run.
+        Like asyncio.to_thread, the coroutine sees the context variables of the caller, e.g. the run statistics.
+        Profiled runs are executed in the calling thread instead, see cinemas.profiling.
+        """
+        if current_profile.get() is not None:
+            # The profiler sees only the calling thread, so a profiled run gets its own loop in it
+            return asyncio.run(coro)
+        loop = self.get_loop()
+        thread, monitor = self.thread, self.monitor
+        future = asyncio.run_coroutine_threadsafe(run_in_context(coro, contextvars.copy_context()), loop)
+        with monitor.watch(current_run_stats.get()) if monitor else contextlib.nullcontext():
+            while True:
+                try:
+                    return future.result(timeout=1)
+                except concurrent.futures.TimeoutError:
+                    # SystemExit and KeyboardInterrupt raised by a coroutine stop the loop without finishing the future
+                    if not thread.is_alive():
+                        raise RuntimeError("The event loop of the worker process stopped")
+
+    def on_shutdown(self, callback: Callable[[], Awaitable]):
+        """
+        Registers a coroutine function closing resources of the loop, e.g. the shared connection pools
+        """
+        self.shutdown_callbacks.append(callback)
+
+    def shutdown(self):
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                return
+            loop, thread, callbacks = self.loop, self.thread, self.shutdown_callbacks
+            self.loop, self.thread, self.monitor, self.shutdown_callbacks = None, None, None, []
+
+        async def close():
+            for callback in callbacks:
+                try:
+                    await callback()
+                except Exception as e:
+                    logging.error(f"Worker loop shutdown error {e!r}")
+
+        asyncio.run_coroutine_threadsafe(close(), loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=10)
+        if not thread.is_alive():
+            loop.close()
+
+
+runtime = WorkerRuntime()
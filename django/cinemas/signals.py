@@ -0,0 +1,12 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from cinemas.models import CinemaProvider
+from cinemas.status import get_provider_cache_key
+
+
+@receiver(post_save, sender=CinemaProvider)
+@receiver(post_delete, sender=CinemaProvider)
+def reset_provider_cache(sender, instance: CinemaProvider, **kwargs):
+    cache.delete(get_provider_cache_key(instance.pk))
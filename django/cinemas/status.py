@@ -0,0 +1,176 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Q, Subquery
+from django.utils.dateparse import parse_datetime
+
+from cinemas.admission import get_queue_positions
+from cinemas.constants import Freshness, ScraperTaskStatus
+from cinemas.locks import get_leased_pairs
+from cinemas.models import CinemaProvider, ScraperTask
+
+
+class ScraperState(NamedTuple):
+    provider: Optional[dict]
+    in_progress: bool
+    task_id: Optional[str]
+    task_created_on: Optional[datetime]
+    # Progress of the running scraper task that has already saved a part of the seats
+    partial: Optional[dict]
+    # Position and estimated wait in seconds of the scraper run waiting in the admission queue
+    queued: Optional[dict] = None
+
+
+# Version of the cached provider info, raised when its fields change so that older entries are not read
+PROVIDER_CACHE_VERSION = 2
+
+
+def get_provider_cache_key(cinema_provider_pk) -> str:
+    return f"scraper_status:provider:v{PROVIDER_CACHE_VERSION}:{cinema_provider_pk}"
+
+
+def get_task_cache_key(cinema_provider_pk, date_query: date) -> str:
+    return f"scraper_status:task:{cinema_provider_pk}:{date_query.isoformat()}"
+
+
+def get_progress_cache_key(cinema_provider_pk, date_query: date) -> str:
+    return f"scraper_status:progress:{cinema_provider_pk}:{date_query.isoformat()}"
+
+
+def get_provider_info(cinema_provider: CinemaProvider) -> dict:
+    return {
+        "name": cinema_provider.name,
+        "cache_time": cinema_provider.cache_time,
+        "max_age": cinema_provider.max_age,
+        "queue": cinema_provider.queue,
+    }
+
+
+def get_provider(cinema_provider_pk) -> Optional[dict]:
+    """
+    Returns the cached info of the cinema provider, None if it does not exist
+    """
+    key = get_provider_cache_key(cinema_provider_pk)
+    provider = cache.get(key)
+    if provider is None:
+        cinema_provider = CinemaProvider.objects.filter(pk=cinema_provider_pk).first()
+        if cinema_provider is None:
+            return None
+        provider = get_provider_info(cinema_provider)
+        cache.set(key, provider, settings.SCRAPERS_STATUS_CACHE_TIME)
+    return provider
+
+
+def get_freshness(provider: dict, age: timedelta) -> Freshness:
+    cache_time = provider.get("cache_time") or settings.SCRAPERS_CACHE_TIME
+    max_age = provider.get("max_age") or settings.SCRAPERS_MAX_AGE
+    age_seconds = age.total_seconds()
+    if age_seconds <= cache_time:
+        return Freshness.FRESH
+    if age_seconds <= max_age:
+        return Freshness.STALE
+    return Freshness.EXPIRED
+
+
+def set_last_task(task: ScraperTask):
+    """
+    Caches the task as the last one of its provider and date. A failed task keeps the data of the previous run,
+    which is served as stale and scraped again on the next request.
+    """
+    if task.status == ScraperTaskStatus.FINISHED:
+        cache.set(
+            get_task_cache_key(task.cinema_provider_id, task.date_query),
+            {"task_id": str(task.pk), "created_on": task.created_on.isoformat()},
+            settings.SCRAPERS_STATUS_CACHE_TIME
+        )
+    cache.delete(get_progress_cache_key(task.cinema_provider_id, task.date_query))
+
+
+def set_task_progress(task: ScraperTask):
+    cache.set(
+        get_progress_cache_key(task.cinema_provider_id, task.date_query),
+        {"task_id": str(task.pk), "saved": task.saved_count, "total": task.showtimes_count},
+        settings.SCRAPERS_LEASE_PENDING_TTL
+    )
+
+
+def get_last_tasks(pairs: List[Tuple[str, date]]) -> List[ScraperTask]:
+    """
+    Returns the last finished scraper task of every (cinema provider pk, date) pair with a single query
+    """
+    pairs_query = Q()
+    for pk, date_query in pairs:
+        pairs_query |= Q(cinema_provider_id=pk, date_query=date_query)
+    last_task = ScraperTask.objects.filter(
+        cinema_provider_id=OuterRef("cinema_provider_id"),
+        date_query=OuterRef("date_query"),
+        is_refresh=False,
+        status=ScraperTaskStatus.FINISHED
+    ).order_by("-created_on").values("pk")[:1]
+    return list(ScraperTask.objects.filter(pairs_query, pk=Subquery(last_task)).only(
+        "cinema_provider_id", "date_query", "created_on"
+    ))
+
+
+def get_scraper_states(pairs: List[Tuple[str, date]]) -> Dict[Tuple[str, date], ScraperState]:
+    """
+    Returns the state of every (cinema provider pk, date) pair with a single cache round trip, a single lease lookup
+    and a single admission queue lookup. The database is only queried for pairs missing from the cache.
+    """
+    provider_keys = {get_provider_cache_key(pk): pk for pk, _ in pairs}
+    task_keys = {get_task_cache_key(pk, date_query): (pk, date_query) for pk, date_query in pairs}
+    progress_keys = {get_progress_cache_key(pk, date_query): (pk, date_query) for pk, date_query in pairs}
+    cached = cache.get_many(list(provider_keys) + list(task_keys) + list(progress_keys))
+
+    providers = {}
+    missed_providers = []
+    for key, pk in provider_keys.items():
+        if key in cached:
+            providers[pk] = cached[key]
+        else:
+            missed_providers.append(pk)
+    if missed_providers:
+        to_cache = {}
+        for cinema_provider in CinemaProvider.objects.filter(pk__in=missed_providers):
+            providers[str(cinema_provider.pk)] = get_provider_info(cinema_provider)
+            to_cache[get_provider_cache_key(cinema_provider.pk)] = providers[str(cinema_provider.pk)]
+        cache.set_many(to_cache, settings.SCRAPERS_STATUS_CACHE_TIME)
+
+    last_tasks = {}
+    missed_pairs = []
+    for key, pair in task_keys.items():
+        if key in cached:
+            last_tasks[pair] = cached[key]
+        elif pair[0] in providers:
+            missed_pairs.append(pair)
+    if missed_pairs:
+        for pair in missed_pairs:
+            last_tasks[pair] = {"task_id": None, "created_on": None}
+        for last_task in get_last_tasks(missed_pairs):
+            last_tasks[(str(last_task.cinema_provider_id), last_task.date_query)] = {
+                "task_id": str(last_task.pk),
+                "created_on": last_task.created_on.isoformat()
+            }
+        cache.set_many(
+            {get_task_cache_key(*pair): last_tasks[pair] for pair in missed_pairs},
+            settings.SCRAPERS_STATUS_CACHE_TIME
+        )
+
+    progress = {pair: cached[key] for key, pair in progress_keys.items() if key in cached}
+    leased_pairs = get_leased_pairs(pairs)
+    queue_positions = get_queue_positions(list(leased_pairs))
+    states = {}
+    for pk, date_query in pairs:
+        last_task = last_tasks.get((pk, date_query), {})
+        created_on = last_task.get("created_on")
+        states[(pk, date_query)] = ScraperState(
+            provider=providers.get(pk),
+            in_progress=(pk, date_query) in leased_pairs,
+            task_id=last_task.get("task_id"),
+            task_created_on=parse_datetime(created_on) if created_on else None,
+            partial=progress.get((pk, date_query)),
+            queued=queue_positions.get((pk, date_query))
+        )
+    return states
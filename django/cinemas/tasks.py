@@ -1,26 +1,407 @@
-import importlib
 import logging
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from types import ModuleType
+from typing import List, Tuple
 
-from cinemas.constants import ScraperStatus
-from cinemas.models import CinemaProvider, ScraperTask
+from celery import chord
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from cinemas.admission import admit_runs, enqueue_run, renew_waiting_runs
+from cinemas.constants import Freshness, ScraperTaskStatus
+from cinemas.locks import ScraperLease
+from cinemas.models import CinemaProvider, ScraperTask, Showtime, ShowtimeSeats
+from cinemas.pipeline import count_showtimes, discover_dates, get_pending_showtimes, save_refreshed, stream_to_tasks
+from cinemas.profiling import profile_run
+from cinemas.refresh import get_showtimes_now, get_showtimes_today
+from cinemas.registry import get_scraper_module, get_scraper_module_str
+from cinemas.routing import get_scraper_queue
+from cinemas.runstats import collect_run_stats, current_run_stats, merge_run_stats, stage
+from cinemas.status import get_freshness, get_scraper_states, set_last_task
 from common.models import Error
+from common.tracing import start_span
 from config.celery import app
 
 
+def get_resumable_task(cinema_provider_obj: CinemaProvider, date_query: datetime.date) -> ScraperTask:
+    # Only the lease holder calls it, so a running task is one interrupted by a worker restart
+    max_age = cinema_provider_obj.max_age or settings.SCRAPERS_MAX_AGE
+    return ScraperTask.objects.filter(
+        cinema_provider=cinema_provider_obj,
+        date_query=date_query,
+        status=ScraperTaskStatus.RUNNING,
+        created_on__gte=timezone.now() - timedelta(seconds=max_age)
+    ).order_by("created_on").last()
+
+
+def get_task(cinema_provider_obj: CinemaProvider, date_query: datetime.date) -> ScraperTask:
+    task = get_resumable_task(cinema_provider_obj, date_query)
+    if task:
+        logging.info(f"Resume task for {cinema_provider_obj.name} {task.id}")
+        task.started_on = timezone.now()
+        task.save(update_fields=["started_on", "updated_on"])
+        return task
+    return ScraperTask.objects.create(cinema_provider=cinema_provider_obj, date_query=date_query,
+                                      started_on=timezone.now())
+
+
+def finish_tasks(tasks: List[ScraperTask], status: ScraperTaskStatus, stats: dict = None):
+    # The tasks of a run share the finish time, the admin trends tell the runs apart by it, see cinemas.trends
+    finished_on = timezone.now()
+    for task in tasks:
+        # Tasks of the dates whose discovery failed are already marked by the scraper
+        if task.status == ScraperTaskStatus.RUNNING:
+            task.status = status
+        task.finished_on = finished_on
+        # All dates of a run share its statistics, the written rows are counted for every task
+        task.stats = dict(stats or {}, rows=ShowtimeSeats.objects.filter(task=task).count())
+        task.save(update_fields=["status", "finished_on", "stats", "updated_on"])
+        set_last_task(task)
+
+
+def get_leases(cinema_provider_pk: str, dates: List[datetime.date], lease_tokens: List[str] = None
+               ) -> List[ScraperLease]:
+    return [
+        ScraperLease(cinema_provider_pk, date_query, lease_token)
+        for date_query, lease_token in zip(dates, lease_tokens or [None] * len(dates))
+    ]
+
+
+def is_redelivered(request) -> bool:
+    return bool((request.delivery_info or {}).get("redelivered"))
+
+
+# The task is redelivered if the worker is restarted in the middle of the run and resumes the interrupted ScraperTasks
+@app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def scan_cinema_dates(self, cinema_provider_pk: str, dates: List[datetime.date], lease_tokens: List[str] = None,
+                      trace_context: dict = None, profile: bool = False, redelivered: bool = False
+                      ) -> List[datetime.date]:
+    """
+    Scrapes several dates of the cinema provider in one run. Movies, movie pages and authorization are requested
+    once for all dates, the seats of every date are saved into its own ScraperTask.
+    The spans of the run are children of trace_context, e.g. of the status request that started the run.
+    A profiled run is never distributed, its profile is saved on the ScraperTasks, see cinemas.profiling.
+    A redelivered task takes the leases over only from a dead worker, the tasks calling it directly pass redelivered.
+    Returns the dates whose leases were taken by the task.
+    """
+    leases = get_leases(cinema_provider_pk, dates, lease_tokens)
+    redelivered = redelivered or is_redelivered(self.request)
+    # In the distributed mode the leases are released by the chord callback
+    distributed = False
+    try:
+        with ExitStack() as stack:
+            stack.enter_context(start_span("scan_cinema", trace_context, cinema_provider=cinema_provider_pk,
+                                           dates=[date_query.isoformat() for date_query in dates]))
+            for lease in leases:
+                stack.enter_context(lease.heartbeat(redelivered=redelivered))
+            run_stats = stack.enter_context(collect_run_stats())
+            run_profile = stack.enter_context(profile_run()) if profile else None
+            leased_dates = [date_query for date_query, lease in zip(dates, leases) if lease.held]
+            if not leased_dates:
+                return []
+            cinema_provider_obj = CinemaProvider.objects.get(pk=cinema_provider_pk)
+            tasks = [get_task(cinema_provider_obj, date_query) for date_query in leased_dates]
+
+            try:
+                scraper_module_str = get_scraper_module_str(cinema_provider_obj.scraper_file)
+                scraper_module = get_scraper_module(cinema_provider_obj)
+                if cinema_provider_obj.shard_size and not profile:
+                    dispatch_shards(cinema_provider_obj, tasks, [lease for lease in leases if lease.held],
+                                    scraper_module)
+                    distributed = True
+                    return leased_dates
+                scraper_module.save_to_django_db(tasks)
+                status = ScraperTaskStatus.FINISHED
+            except Exception as e:
+                Error.objects.create(title=str(e), source=scraper_module_str)
+                logging.error(f"Celery task execution error {e}")
+                status = ScraperTaskStatus.FAILED
+            stats = run_stats.as_dict()
+            if run_profile:
+                run_profile.save(tasks)
+                stats["memory"] = run_profile.memory
+            finish_tasks(tasks, status, stats)
+    finally:
+        if not distributed:
+            for lease in leases:
+                lease.release()
+            start_admitted_scrapers()
+    return leased_dates
+
+
+def dispatch_shards(cinema_provider_obj: CinemaProvider,
+                    tasks: List[ScraperTask],
+                    leases: List[ScraperLease],
+                    scraper_module: ModuleType):
+    """
+    Distributed mode of big cinema providers. Showtimes are discovered by this task, their seats are requested
+    by shards of shard_size showtimes on any worker, and the chord callback finishes the ScraperTasks.
+    """
+    task_pks = [str(task.pk) for task in tasks]
+    # Leases of all dates are renewed by the shards and released by the callback, also of the failed ones
+    dates = [task.date_query for task in tasks]
+    lease_tokens = [lease.token for lease in leases]
+    with stage("discovery"):
+        tasks = {task.date_query: task for task in discover_dates(tasks, scraper_module.discover_showtimes)}
+    showtimes = get_pending_showtimes(tasks)
+    count_showtimes(tasks, showtimes)
+
+    # Showtimes of the same cinema and movie are kept in one shard
+    showtimes.sort(key=lambda showtime: (str(showtime.cinema_id), str(showtime.movie_id), showtime.datetime))
+    shard_size = cinema_provider_obj.shard_size
+    shards = [
+        [str(showtime.pk) for showtime in showtimes[i:i + shard_size]]
+        for i in range(0, len(showtimes), shard_size)
+    ]
+    cinema_provider_pk = str(cinema_provider_obj.pk)
+    # The leases are kept while the shards are waiting in the queue
+    for lease in leases:
+        lease.renew(settings.SCRAPERS_LEASE_PENDING_TTL)
+
+    # Statistics of the discovery are merged with the statistics of the shards by the callback
+    finish = finish_shards.s(cinema_provider_pk, task_pks, dates, lease_tokens, current_run_stats.get().as_dict())
+    if not shards:
+        finish.delay([])
+        return
+    logging.info(f"Dispatch {len(shards)} shards of {len(showtimes)} showtimes for {cinema_provider_obj.name}")
+    chord(
+        scan_shard.s(cinema_provider_pk, task_pks, shard, dates, lease_tokens)
+        for shard in shards
+    )(finish)
+
+
+@app.task(acks_late=True, reject_on_worker_lost=True)
+def scan_shard(cinema_provider_pk: str, task_pks: List[str], showtime_pks: List[str], dates: List[datetime.date],
+               lease_tokens: List[str]) -> dict:
+    """
+    Returns the statistics of the shard together with the number of its showtimes
+    """
+    leases = get_leases(cinema_provider_pk, dates, lease_tokens)
+    run_stats = None
+    try:
+        with ExitStack() as stack:
+            for lease in leases:
+                stack.enter_context(lease.heartbeat())
+            run_stats = stack.enter_context(collect_run_stats())
+            tasks = {
+                task.date_query: task
+                for task in ScraperTask.objects.filter(
+                    pk__in=task_pks,
+                    status=ScraperTaskStatus.RUNNING
+                ).select_related("cinema_provider")
+            }
+            if not tasks:
+                return {"showtimes": 0}
+            scraper_module = get_scraper_module(next(iter(tasks.values())).cinema_provider)
+            showtimes = get_pending_showtimes(tasks, showtime_pks)
+            stream_to_tasks(tasks, showtimes, scraper_module.stream_showtimes)
+            return dict(run_stats.as_dict(), showtimes=len(showtimes))
+    except Exception as e:
+        # A failed shard does not fail the chord, the tasks are finished with the seats of the other shards
+        Error.objects.create(title=str(e), source=f"shard of {cinema_provider_pk}")
+        logging.error(f"Celery shard execution error {e}")
+        return dict(run_stats.as_dict() if run_stats else {}, showtimes=0)
+    finally:
+        # The leases are kept for the next shards and the chord callback
+        for lease in leases:
+            lease.renew(settings.SCRAPERS_LEASE_PENDING_TTL)
+
+
 @app.task()
-def scan_cinema(cinema_provider_pk: str, date_query: datetime.date) -> bool:
+def finish_shards(shards_stats: List[dict], cinema_provider_pk: str, task_pks: List[str],
+                  dates: List[datetime.date], lease_tokens: List[str], stats: dict = None) -> int:
+    finish_tasks(
+        list(ScraperTask.objects.filter(pk__in=task_pks)),
+        ScraperTaskStatus.FINISHED,
+        merge_run_stats([stats or {}] + shards_stats)
+    )
+    for lease in get_leases(cinema_provider_pk, dates, lease_tokens):
+        lease.release()
+    start_admitted_scrapers()
+    showtimes_count = sum(shard_stats["showtimes"] for shard_stats in shards_stats)
+    logging.info(f"Finished {len(shards_stats)} shards of {showtimes_count} showtimes for {cinema_provider_pk}")
+    return showtimes_count
+
+
+@app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def scan_cinema(self, cinema_provider_pk: str, date_query: datetime.date, lease_token: str = None) -> bool:
+    return bool(scan_cinema_dates(cinema_provider_pk, [date_query], [lease_token],
+                                  redelivered=is_redelivered(self.request)))
+
+
+@app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def scan_cinemas(self, runs: List[list]) -> int:
+    """
+    Scrapes several cinema providers in one task. Every run is [cinema provider pk, dates, lease tokens, trace context].
+    The runs are started in threads, while all their requests are made in the event loop of the worker process
+    with the limits of every scraper. The seats of all runs are saved by the single database thread of sync_to_async.
+    Returns the number of scraped dates.
+    """
+    redelivered = is_redelivered(self.request)
+
+    def scan(run: list) -> int:
+        try:
+            return len(scan_cinema_dates(*run, redelivered=redelivered))
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(runs), thread_name_prefix="scan-cinemas") as executor:
+        return sum(executor.map(scan, runs))
+
+
+def dispatch_runs(runs: List[list]):
+    """
+    Sends the admitted runs to the workers, every run is [cinema provider pk, dates, lease tokens, trace context]
+    """
+    # Cinema providers with their own queues are scraped by their own workers
+    queues_runs = {}
+    for run in runs:
+        queues_runs.setdefault(get_scraper_queue(run[0]), []).append(run)
+    for queue_runs in queues_runs.values():
+        if len(queue_runs) == 1:
+            scan_cinema_dates.delay(*queue_runs[0])
+        else:
+            scan_cinemas.delay(queue_runs)
+
+
+def start_admitted_scrapers() -> int:
+    # Called whenever a run finishes, so the next waiting runs take its slot right away
+    try:
+        runs = admit_runs()
+    except Exception as e:
+        logging.error(f"Scraper admission error {e}")
+        return 0
+    dispatch_runs(runs)
+    return len(runs)
+
+
+def start_scraper(cinema_provider_pk: str, date_query: datetime.date) -> bool:
+    return bool(start_scraper_dates(cinema_provider_pk, [date_query]))
+
+
+def start_scraper_dates(cinema_provider_pk: str, dates: List[datetime.date]) -> List[datetime.date]:
+    return [date_query for _, date_query in start_scrapers([(cinema_provider_pk, date_query) for date_query in dates])]
+
+
+def start_profiled_scraper(cinema_provider_pk: str, date_query: datetime.date) -> bool:
+    """
+    Starts a profiled run of the pair, bypassing the admission queue. Returns False if the pair is already leased.
+    """
+    lease = ScraperLease(cinema_provider_pk, date_query)
+    if not lease.acquire():
+        return False
+    scan_cinema_dates.delay(cinema_provider_pk, [date_query], [lease.token], profile=True)
+    return True
+
+
+def start_scrapers(pairs: List[Tuple[str, datetime.date]]) -> List[Tuple[str, datetime.date]]:
+    """
+    Puts the scraper runs of the pairs into the admission queue, the dates of one cinema provider are scraped by
+    one run. Concurrent requests for the same pair are coalesced onto one run, pairs leased by other runs are skipped.
+    """
+    runs = {}
+    started = []
+    for cinema_provider_pk, date_query in pairs:
+        lease = ScraperLease(cinema_provider_pk, date_query)
+        if not lease.acquire():
+            continue
+        run = runs.setdefault(cinema_provider_pk, [cinema_provider_pk, [], []])
+        run[1].append(date_query)
+        run[2].append(lease.token)
+        started.append((cinema_provider_pk, date_query))
+
+    for run in runs.values():
+        enqueue_run(*run)
+    if runs:
+        start_admitted_scrapers()
+    return started
+
+
+@app.task()
+def admit_scrapers() -> int:
+    """
+    Keeps the leases of the waiting runs and admits them when the slots of dead workers expire
+    """
+    waiting = renew_waiting_runs()
+    admitted = start_admitted_scrapers()
+    if waiting:
+        logging.info(f"Admitted {admitted} of {waiting} waiting scraper runs")
+    return admitted
+
+
+@app.task()
+def prewarm_scrapers() -> int:
+    now = timezone.now()
+    today = get_showtimes_today()
+    started = 0
+    for cinema_provider_obj in CinemaProvider.objects.filter(is_available=True, prewarm_enabled=True):
+        if cinema_provider_obj.prewarmed_on and \
+                now - cinema_provider_obj.prewarmed_on < timedelta(minutes=cinema_provider_obj.prewarm_interval):
+            continue
+
+        pairs = [
+            (str(cinema_provider_obj.pk), today + timedelta(days=day))
+            for day in range(cinema_provider_obj.prewarm_days + 1)
+        ]
+        dates = []
+        for (cinema_provider_pk, date_query), state in get_scraper_states(pairs).items():
+            if state.in_progress:
+                continue
+            if state.task_id and get_freshness(state.provider, now - state.task_created_on) == Freshness.FRESH:
+                continue
+            dates.append(date_query)
+        if dates:
+            started += len(start_scraper_dates(str(cinema_provider_obj.pk), dates))
+        CinemaProvider.objects.filter(pk=cinema_provider_obj.pk).update(prewarmed_on=now)
+
+    logging.info(f"Prewarm started scrapers for {started} dates")
+    return started
+
+
+@app.task()
+def refresh_due_showtimes() -> int:
+    now = timezone.now()
+    due_showtimes = Showtime.objects.filter(
+        next_refresh_on__lte=now,
+        is_active=True,
+        datetime__gt=get_showtimes_now(),
+        cinema_provider__is_available=True,
+    ).order_by("next_refresh_on")
+
+    batches = {}
+    for showtime_pk, cinema_provider_pk in due_showtimes.values_list("pk", "cinema_provider_id"):
+        batches.setdefault(str(cinema_provider_pk), []).append(str(showtime_pk))
+
+    for cinema_provider_pk, showtime_pks in batches.items():
+        for i in range(0, len(showtime_pks), settings.SHOWTIMES_REFRESH_BATCH_SIZE):
+            batch = showtime_pks[i:i + settings.SHOWTIMES_REFRESH_BATCH_SIZE]
+            # Do not dispatch the same showtimes again while the refresh task is waiting in the queue
+            Showtime.objects.filter(pk__in=batch).update(
+                next_refresh_on=now + timedelta(seconds=settings.SCRAPERS_LEASE_PENDING_TTL)
+            )
+            refresh_showtimes.delay(cinema_provider_pk, batch)
+
+    showtimes_count = sum(len(showtime_pks) for showtime_pks in batches.values())
+    logging.info(f"Dispatched refresh of {showtimes_count} showtimes")
+    return showtimes_count
+
+
+@app.task()
+def refresh_showtimes(cinema_provider_pk: str, showtime_pks: list) -> int:
     cinema_provider_obj = CinemaProvider.objects.get(pk=cinema_provider_pk)
-    task = ScraperTask.objects.create(cinema_provider=cinema_provider_obj, date_query=date_query)
+    showtimes = list(Showtime.objects.filter(pk__in=showtime_pks, datetime__gt=get_showtimes_now()))
 
+    scraper_module_str = get_scraper_module_str(cinema_provider_obj.scraper_file)
     try:
-        scraper_module_str = cinema_provider_obj.scraper_file.replace("/", ".")[0:-3]
-        scraper_module = importlib.import_module(scraper_module_str)
-        scraper_module.save_to_django_db(task)
+        scraper_module = get_scraper_module(cinema_provider_obj)
+        results = scraper_module.refresh_showtimes(showtimes)
     except Exception as e:
         Error.objects.create(title=str(e), source=scraper_module_str)
         logging.error(f"Celery task execution error {e}")
+        results = {}
 
-    cinema_provider_obj.scraper_status = ScraperStatus.AVAILABLE
-    cinema_provider_obj.save()
-    return True
+    save_refreshed(cinema_provider_pk, showtimes, results)
+    return len(showtimes)
@@ -0,0 +1,49 @@
+import datetime as dt
+from datetime import datetime
+from unittest import mock
+
+import fakeredis
+from django.core.cache import cache
+
+from cinemas.discovery import DiscoveredShowtime
+from cinemas.models import CinemaProvider
+
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class RedisTestMixin:
+    """
+    Replaces Redis with fakeredis, which runs the Lua scripts of the leases, the admission queue and the rate limits
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Every test gets its own server, the instances with the default address share their data
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        for module in ["common.redis", "cinemas.locks", "cinemas.admission", "scrapers.engine.limiter"]:
+            patcher = mock.patch(f"{module}.get_redis", return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.clear()
+
+
+def create_cinema_provider(**kwargs) -> CinemaProvider:
+    return CinemaProvider.objects.create(
+        name=kwargs.pop("name", "Novo Cinemas"),
+        scraper_file="scrapers/novocinemas.py",
+        logo="logo.png",
+        **kwargs
+    )
+
+
+def create_discovered(external_id: str, hour: int = 18, **kwargs) -> DiscoveredShowtime:
+    return DiscoveredShowtime(
+        external_id=external_id,
+        country="UAE",
+        cinema=kwargs.pop("cinema", "Dubai Mall"),
+        movie=kwargs.pop("movie", "Movie"),
+        language="EN",
+        datetime=datetime(2030, 1, 1, hour, tzinfo=dt.timezone.utc),
+        payload=kwargs.pop("payload", {"id": external_id}),
+        **kwargs
+    )
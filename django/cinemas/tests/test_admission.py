@@ -0,0 +1,37 @@
+from datetime import date
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from cinemas.admission import admit_runs, enqueue_run, get_queue_positions
+from cinemas.locks import ScraperLease
+from cinemas.tests.base import TEST_CACHES, RedisTestMixin
+
+
+@override_settings(CACHES=TEST_CACHES, SCRAPERS_MAX_RUNS=1, SCRAPERS_MAX_PROVIDER_RUNS=0)
+class AdmissionTests(RedisTestMixin, SimpleTestCase):
+
+    def enqueue(self, cinema_provider_pk: str, date_query: date) -> ScraperLease:
+        lease = ScraperLease(cinema_provider_pk, date_query)
+        lease.acquire()
+        enqueue_run(cinema_provider_pk, [date_query], [lease.token])
+        return lease
+
+    @mock.patch("cinemas.admission.get_run_duration", return_value=60)
+    def test_runs_are_admitted_in_order_when_slots_free(self, get_run_duration):
+        first = self.enqueue("first", date(2030, 1, 1))
+        self.enqueue("second", date(2030, 1, 1))
+
+        runs = admit_runs()
+        self.assertEqual([(run[0], run[1]) for run in runs], [("first", [date(2030, 1, 1)])])
+        self.assertEqual(admit_runs(), [])
+        self.assertEqual(
+            get_queue_positions([("second", date(2030, 1, 1)), ("first", date(2030, 1, 1))]),
+            {("second", date(2030, 1, 1)): {"position": 1, "wait": 60}}
+        )
+
+        # The slot is freed as soon as the lease of the admitted run is released
+        first.release()
+        runs = admit_runs()
+        self.assertEqual([run[0] for run in runs], ["second"])
+        self.assertEqual(get_queue_positions([("second", date(2030, 1, 1))]), {})
@@ -0,0 +1,62 @@
+from datetime import date, timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from cinemas.discovery import reconcile_showtimes
+from cinemas.models import ScraperTask, Showtime, ShowtimeDiscovery
+from cinemas.pipeline import discover_dates
+from cinemas.tests.base import TEST_CACHES, create_cinema_provider, create_discovered
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReconcileShowtimesTests(TestCase):
+
+    def setUp(self):
+        self.cinema_provider = create_cinema_provider(discovery_interval=60)
+        self.date_query = date(2030, 1, 1)
+
+    def test_showtimes_are_updated_in_place(self):
+        reconcile_showtimes(self.cinema_provider, self.date_query, [create_discovered("1"), create_discovered("2")])
+        showtime = Showtime.objects.get(external_id="1")
+
+        reconcile_showtimes(self.cinema_provider, self.date_query, [
+            create_discovered("1", hour=20, payload={"id": "1", "session": "new"}, experience="IMAX"),
+            create_discovered("2"),
+        ])
+        updated = Showtime.objects.get(external_id="1")
+        self.assertEqual(updated.pk, showtime.pk)
+        self.assertEqual(updated.datetime.hour, 20)
+        self.assertEqual(updated.payload, {"id": "1", "session": "new"})
+        self.assertEqual(updated.experience, "IMAX")
+        self.assertEqual(Showtime.objects.count(), 2)
+
+    def test_showtimes_no_longer_listed_are_deactivated(self):
+        reconcile_showtimes(self.cinema_provider, self.date_query, [create_discovered("1"), create_discovered("2")])
+        reconcile_showtimes(self.cinema_provider, date(2030, 1, 2), [create_discovered("3")])
+
+        discovery = reconcile_showtimes(self.cinema_provider, self.date_query, [create_discovered("1")])
+        self.assertEqual(discovery.showtimes_count, 1)
+        self.assertEqual(
+            dict(Showtime.objects.values_list("external_id", "is_active")),
+            {"1": True, "2": False, "3": True}
+        )
+
+        # A showtime listed again is active again
+        reconcile_showtimes(self.cinema_provider, self.date_query, [create_discovered("1"), create_discovered("2")])
+        self.assertTrue(Showtime.objects.get(external_id="2").is_active)
+
+    def test_discovery_interval_is_respected(self):
+        discover_showtimes = mock.Mock(return_value={self.date_query: [create_discovered("1")]})
+        tasks = [ScraperTask.objects.create(cinema_provider=self.cinema_provider, date_query=self.date_query)]
+
+        discover_dates(tasks, discover_showtimes)
+        discover_dates(tasks, discover_showtimes)
+        # The second run requests the seats of the showtimes found by the first one
+        discover_showtimes.assert_called_once_with([self.date_query])
+
+        ShowtimeDiscovery.objects.update(created_on=timezone.now() - timedelta(minutes=61))
+        discover_dates(tasks, discover_showtimes)
+        self.assertEqual(discover_showtimes.call_count, 2)
+        self.assertEqual(ShowtimeDiscovery.objects.count(), 2)
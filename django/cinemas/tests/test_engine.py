@@ -0,0 +1,155 @@
+import asyncio
+import time
+from collections import Counter
+from unittest import mock
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from django.test import SimpleTestCase, override_settings
+
+from cinemas.runtime import runtime
+from scrapers.engine import BaseScraper, ScraperRequestError
+
+
+class EchoScraper(BaseScraper):
+    name = "echo"
+    retries = 2
+    retry_delay = 0.1
+    movies_cache_time = 0
+
+    def check_response(self, text: str) -> bool:
+        return text != "error"
+
+
+@override_settings(SCRAPERS_RATE_LIMIT=0)
+class ScraperClientTests(SimpleTestCase):
+    """
+    Requests of the engine against a local aiohttp server, run in the worker loop like the celery tasks
+    """
+
+    def setUp(self):
+        self.hits = Counter()
+        self.responses = {}
+        self.scraper = EchoScraper()
+        self.addCleanup(runtime.shutdown)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.hits[request.path_qs] += 1
+        if request.path == "/slow":
+            await asyncio.sleep(0.1)
+        if request.path == "/cookies":
+            return web.json_response(dict(request.cookies))
+        if request.path == "/login":
+            response = web.Response(text="ok")
+            response.set_cookie("session", request.query["user"])
+            return response
+        responses = self.responses.get(request.path, [])
+        status, text = responses.pop(0) if responses else (200, "ok")
+        return web.Response(status=status, text=text)
+
+    def run_with_server(self, scenario):
+        async def run():
+            app = web.Application()
+            app.router.add_route("*", "/{path:.*}", self.handle)
+            server = TestServer(app, host="localhost")
+            await server.start_server()
+            try:
+                # Cookies of IP addresses are rejected by the cookie jar of the sessions, the URLs use the host name
+                return await scenario(lambda path: f"http://localhost:{server.port}{path}")
+            finally:
+                await server.close()
+
+        return runtime.run(run())
+
+    @mock.patch("scrapers.engine.client.random.uniform", return_value=1)
+    def test_server_errors_are_retried_with_backoff(self, uniform):
+        self.responses["/page"] = [(500, "error"), (503, "error")]
+
+        async def scenario(url):
+            async with self.scraper.open_client() as client:
+                started = time.monotonic()
+                text = await client.get(url("/page"))
+                return text, time.monotonic() - started, client.stats
+
+        text, duration, stats = self.run_with_server(scenario)
+        self.assertEqual(text, "ok")
+        self.assertEqual(self.hits["/page"], 3)
+        self.assertEqual(stats.retries, 2)
+        self.assertEqual(stats.statuses, {"500": 1, "503": 1, "200": 1})
+        # 0.1s before the first retry and 0.2s before the second one
+        self.assertGreaterEqual(duration, 0.3)
+
+    def test_retries_are_limited(self):
+        self.responses["/page"] = [(500, "error")] * 3
+
+        async def scenario(url):
+            async with self.scraper.open_client() as client:
+                with self.assertRaises(ScraperRequestError):
+                    await client.get(url("/page"))
+                return client.stats
+
+        stats = self.run_with_server(scenario)
+        self.assertEqual(self.hits["/page"], 3)
+        self.assertEqual(stats.failed_requests, 1)
+
+    def test_client_errors_are_not_retried(self):
+        self.responses["/page"] = [(404, "not found")]
+
+        async def scenario(url):
+            async with self.scraper.open_client() as client:
+                with self.assertRaises(ScraperRequestError):
+                    await client.get(url("/page"))
+                return client.stats
+
+        stats = self.run_with_server(scenario)
+        self.assertEqual(self.hits["/page"], 1)
+        self.assertEqual(stats.retries, 0)
+        self.assertEqual(stats.failed_requests, 1)
+
+    def test_rejected_response_is_retried(self):
+        self.responses["/page"] = [(200, "error")]
+
+        async def scenario(url):
+            async with self.scraper.open_client() as client:
+                return await client.get(url("/page")), client.stats
+
+        text, stats = self.run_with_server(scenario)
+        self.assertEqual(text, "ok")
+        self.assertEqual(self.hits["/page"], 2)
+        self.assertEqual(stats.retries, 1)
+
+    def test_cached_request_is_made_once(self):
+        async def scenario(url):
+            async with self.scraper.open_client() as client:
+                url = url("/slow")
+                texts = await asyncio.gather(*[client.get_cached(url, {"date": "2030-01-01"}) for _ in range(5)])
+                await client.get_cached(url, {"date": "2030-01-01"})
+                await client.get_cached(url, {"date": "2030-01-02"})
+                return texts
+
+        self.assertEqual(self.run_with_server(scenario), ["ok"] * 5)
+        self.assertEqual(self.hits, {"/slow?date=2030-01-01": 1, "/slow?date=2030-01-02": 1})
+
+    def test_runs_share_connections_but_not_cookies(self):
+        async def scenario(url):
+            async with self.scraper.open_client() as first:
+                await first.get(url("/login"), {"user": "first"})
+                first_cookies = await first.get_json(url("/cookies"))
+                async with first.isolated() as isolated:
+                    await isolated.get(url("/login"), {"user": "isolated"})
+                    isolated_cookies = await isolated.get_json(url("/cookies"))
+                    isolated_connector = isolated.session.connector
+                first_connector = first.session.connector
+            async with self.scraper.open_client() as second:
+                second_cookies = await second.get_json(url("/cookies"))
+                second_connector = second.session.connector
+            return (first_cookies, isolated_cookies, second_cookies,
+                    {first_connector, isolated_connector, second_connector})
+
+        first_cookies, isolated_cookies, second_cookies, connectors = self.run_with_server(scenario)
+        self.assertEqual(first_cookies, {"session": "first"})
+        self.assertEqual(isolated_cookies, {"session": "isolated"})
+        self.assertEqual(second_cookies, {})
+        # The connection pool of the scraper outlives the sessions of its runs
+        self.assertEqual(connectors, {self.scraper.connector})
+        self.assertFalse(self.scraper.connector.closed)
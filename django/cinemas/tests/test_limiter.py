@@ -0,0 +1,69 @@
+import asyncio
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from cinemas.runtime import runtime
+from cinemas.tests.base import TEST_CACHES, RedisTestMixin
+from scrapers.engine import BaseScraper
+from scrapers.engine.limiter import RateLimiter
+
+
+class LimitedScraper(BaseScraper):
+    name = "limited"
+    rate_limit = 10
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RateLimiterTests(RedisTestMixin, SimpleTestCase):
+
+    def test_burst_is_taken_at_once(self):
+        limiter = RateLimiter(rate=10, burst=5, prefetch=5)
+        self.assertEqual(limiter.take("host", 10), (5, 0))
+        taken, wait = limiter.take("host", 1)
+        self.assertEqual(taken, 0)
+        # The next token is refilled in 1/rate seconds
+        self.assertTrue(0 < wait <= 100, wait)
+        # Other hosts have their own buckets
+        self.assertEqual(limiter.take("other", 1), (1, 0))
+
+    def test_tokens_are_refilled_at_rate(self):
+        limiter = RateLimiter(rate=10, burst=5, prefetch=5)
+        limiter.take("host", 5)
+        time.sleep(0.35)
+        self.assertEqual(limiter.take("host", 5)[0], 3)
+        # The bucket does not fill up beyond the burst
+        time.sleep(0.6)
+        self.assertEqual(limiter.take("host", 10)[0], 5)
+
+    async def test_acquire_returns_wait(self):
+        limiter = RateLimiter(rate=10, burst=1, prefetch=1)
+        self.assertLess(await limiter.acquire("host"), 0.05)
+        self.assertGreaterEqual(await limiter.acquire("host"), 0.05)
+
+    async def test_prefetched_tokens_save_round_trips(self):
+        limiter = RateLimiter(rate=10, burst=5, prefetch=5)
+        with mock.patch.object(limiter, "take", wraps=limiter.take) as take:
+            for _ in range(5):
+                self.assertLess(await limiter.acquire("host"), 0.05)
+            take.assert_called_once_with("host", 5)
+        # The bucket is empty, the next request waits for its refill
+        self.assertGreaterEqual(await limiter.acquire("host"), 0.05)
+
+    def test_runs_share_rate_limiter(self):
+        scraper = LimitedScraper()
+        self.addCleanup(runtime.shutdown)
+
+        async def open_clients():
+            async with scraper.open_client() as first:
+                pass
+            async with scraper.open_client() as second:
+                pass
+            return first.rate_limiter, second.rate_limiter
+
+        first, second = runtime.run(open_clients())
+        self.assertIs(first, second)
+        self.assertEqual(first.rate, 10)
+        # Runs outside of the worker loop have their own limiter
+        self.assertIsNot(asyncio.run(open_clients())[0], first)
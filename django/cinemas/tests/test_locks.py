@@ -0,0 +1,50 @@
+import time
+from datetime import date
+
+from django.test import SimpleTestCase, override_settings
+
+from cinemas.locks import ScraperLease, get_leased_pairs
+from cinemas.tests.base import TEST_CACHES, RedisTestMixin
+
+
+@override_settings(CACHES=TEST_CACHES, SCRAPERS_LEASE_TTL=1)
+class ScraperLeaseTests(RedisTestMixin, SimpleTestCase):
+
+    def test_lease_is_exclusive(self):
+        lease = ScraperLease("provider", date(2030, 1, 1))
+        self.assertTrue(lease.acquire())
+        self.assertFalse(ScraperLease("provider", date(2030, 1, 1)).acquire())
+        self.assertTrue(ScraperLease("provider", date(2030, 1, 2)).acquire())
+        self.assertEqual(
+            get_leased_pairs([("provider", date(2030, 1, 1)), ("provider", date(2030, 1, 3))]),
+            {("provider", date(2030, 1, 1))}
+        )
+
+    def test_only_owner_releases(self):
+        lease = ScraperLease("provider", date(2030, 1, 1))
+        lease.acquire()
+        self.assertFalse(ScraperLease("provider", date(2030, 1, 1)).release())
+        self.assertTrue(lease.release())
+        self.assertTrue(ScraperLease("provider", date(2030, 1, 1)).acquire())
+
+    def test_heartbeat_keeps_lease(self):
+        lease = ScraperLease("provider", date(2030, 1, 1))
+        lease.acquire()
+        with lease.heartbeat() as held:
+            self.assertTrue(held.held)
+            time.sleep(1.5)
+            with ScraperLease("provider", date(2030, 1, 1)).heartbeat() as other:
+                self.assertFalse(other.held)
+        self.assertTrue(self.redis.exists(lease.key))
+
+    def test_redelivered_task_takes_over_pending_lease(self):
+        lease = ScraperLease("provider", date(2030, 1, 1))
+        lease.acquire()
+        with ScraperLease("provider", date(2030, 1, 1), lease.token).heartbeat(redelivered=True) as redelivered:
+            self.assertTrue(redelivered.held)
+
+    def test_redelivered_task_waits_for_running_worker(self):
+        lease = ScraperLease("provider", date(2030, 1, 1))
+        with lease.heartbeat():
+            with ScraperLease("provider", date(2030, 1, 1), lease.token).heartbeat(redelivered=True) as redelivered:
+                self.assertFalse(redelivered.held)
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from cinemas.runstats import collect_run_stats
+from cinemas.runtime import WorkerRuntime
+
+
+@override_settings(SCRAPERS_LOOP_MONITOR=True, SCRAPERS_LOOP_MONITOR_INTERVAL=0.05, SCRAPERS_LOOP_BLOCK_THRESHOLD=0.1)
+class LoopMonitorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.runtime = WorkerRuntime()
+        self.addCleanup(self.runtime.shutdown)
+
+    def test_blocking_call_is_recorded(self):
+        async def scrape():
+            time.sleep(0.5)
+            # The run is still watched when the monitor records the lag of the blocked loop
+            await asyncio.sleep(0.2)
+
+        with self.assertLogs("cinemas.loopmonitor", "WARNING") as logs, collect_run_stats() as stats:
+            self.runtime.run(scrape())
+
+        self.assertEqual(len(stats.loop_blocks), 1)
+        location = next(iter(stats.loop_blocks))
+        self.assertTrue(location.startswith("cinemas/tests/test_loopmonitor.py:"))
+        self.assertTrue(location.endswith(" scrape"))
+        self.assertGreaterEqual(stats.loop_blocked, 0.3)
+        self.assertGreaterEqual(stats.loop_max_lag, 0.3)
+        self.assertIn(location, logs.output[0])
+        self.assertIn("time.sleep(0.5)", logs.output[0])
+        self.assertEqual(stats.as_dict()["loop"]["blocks"], {location: 1})
+
+    def test_non_blocking_run_records_nothing(self):
+        async def scrape():
+            await asyncio.sleep(0.3)
+
+        with self.assertNoLogs("cinemas.loopmonitor", "WARNING"), collect_run_stats() as stats:
+            self.runtime.run(scrape())
+
+        self.assertGreater(stats.loop_samples, 0)
+        self.assertEqual(stats.loop_blocks, {})
+        self.assertEqual(stats.loop_blocked, 0)
@@ -0,0 +1,109 @@
+import asyncio
+from contextlib import aclosing
+from datetime import date, timedelta
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from cinemas.constants import ScraperTaskStatus
+from cinemas.models import Movie, ScraperTask, Showtime
+from cinemas.pipeline import get_pending_showtimes, iter_stage
+from cinemas.tasks import get_task
+from cinemas.tests.base import TEST_CACHES, RedisTestMixin, create_cinema_provider
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ResumeTests(RedisTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cinema_provider = create_cinema_provider()
+        movie = Movie.objects.create(name="Movie")
+        self.showtimes = [
+            Showtime.objects.create(
+                cinema_provider=self.cinema_provider,
+                external_id=str(i),
+                movie=movie,
+                date_query=date(2030, 1, 1),
+                datetime=timezone.now() + timedelta(days=1)
+            )
+            for i in range(3)
+        ]
+
+    def test_interrupted_task_is_resumed(self):
+        task = ScraperTask.objects.create(cinema_provider=self.cinema_provider, date_query=date(2030, 1, 1))
+        task.completed_showtimes.add(self.showtimes[0])
+
+        resumed = get_task(self.cinema_provider, date(2030, 1, 1))
+        self.assertEqual(resumed.pk, task.pk)
+        self.assertIsNotNone(resumed.started_on)
+        self.assertEqual(
+            {showtime.pk for showtime in get_pending_showtimes({date(2030, 1, 1): resumed})},
+            {self.showtimes[1].pk, self.showtimes[2].pk}
+        )
+
+    def test_finished_task_is_not_resumed(self):
+        task = ScraperTask.objects.create(cinema_provider=self.cinema_provider, date_query=date(2030, 1, 1),
+                                          status=ScraperTaskStatus.FINISHED)
+        new_task = get_task(self.cinema_provider, date(2030, 1, 1))
+        self.assertNotEqual(new_task.pk, task.pk)
+        self.assertEqual(len(get_pending_showtimes({date(2030, 1, 1): new_task})), 3)
+
+
+class IterStageTests(SimpleTestCase):
+
+    async def test_concurrency_is_limited(self):
+        running = 0
+        max_running = 0
+
+        async def process(item: int) -> int:
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01 * (item % 3))
+            running -= 1
+            return item * 2
+
+        results = [result async for result in iter_stage(list(range(20)), process, 3)]
+        self.assertEqual(max_running, 3)
+        self.assertEqual(sorted(results), [(item, item * 2) for item in range(20)])
+
+    async def test_exception_reaches_consumer(self):
+        async def process(item: int) -> int:
+            await asyncio.sleep(0.01)
+            if item == 3:
+                raise ValueError("Item 3 failed")
+            return item
+
+        results = []
+        with self.assertRaisesMessage(ValueError, "Item 3 failed"):
+            async for result in iter_stage(list(range(10)), process, 2):
+                results.append(result)
+        self.assertNotIn((3, 3), results)
+        await asyncio.sleep(0)
+        self.assertEqual(asyncio.all_tasks(), {asyncio.current_task()})
+
+    async def test_workers_are_cancelled_when_consumer_stops(self):
+        started = 0
+        cancelled = 0
+
+        async def process(item: int) -> int:
+            nonlocal started, cancelled
+            if item == 0:
+                return item
+            started += 1
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled += 1
+                raise
+
+        async with aclosing(iter_stage(list(range(10)), process, 4)) as results:
+            async for result in results:
+                self.assertEqual(result, (0, 0))
+                break
+        await asyncio.sleep(0)
+        # Every worker still waiting for its item is cancelled together with the producer
+        self.assertGreaterEqual(started, 3)
+        self.assertEqual(cancelled, started)
+        self.assertEqual(asyncio.all_tasks(), {asyncio.current_task()})
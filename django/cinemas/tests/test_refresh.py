@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from cinemas.models import Movie, Showtime
+from cinemas.refresh import get_refresh_interval, get_showtimes_now, observe_sold
+from cinemas.tasks import refresh_due_showtimes
+from cinemas.tests.base import TEST_CACHES, create_cinema_provider
+
+
+class RefreshIntervalTests(SimpleTestCase):
+
+    def test_tiers(self):
+        for starts_in, interval in [
+            (timedelta(minutes=30), timedelta(minutes=5)),
+            (timedelta(hours=2), timedelta(minutes=15)),
+            (timedelta(hours=6), timedelta(hours=1)),
+            (timedelta(days=1), timedelta(hours=3)),
+            (timedelta(days=5), timedelta(hours=12)),
+        ]:
+            self.assertEqual(get_refresh_interval(starts_in, 0, False), interval, starts_in)
+
+    def test_sold_rate(self):
+        # Fast selling showtimes are refreshed twice as often, but not more often than the minimum interval
+        self.assertEqual(get_refresh_interval(timedelta(hours=6), 10, True), timedelta(minutes=30))
+        self.assertEqual(get_refresh_interval(timedelta(minutes=30), 50, True), timedelta(minutes=5))
+        # Showtimes without sales since the last refresh are refreshed half as often, up to the maximum interval
+        self.assertEqual(get_refresh_interval(timedelta(days=1), 0, True), timedelta(hours=6))
+        self.assertEqual(get_refresh_interval(timedelta(days=5), 0, True), timedelta(hours=12))
+        # The first observation has no sold rate yet
+        self.assertEqual(get_refresh_interval(timedelta(days=1), 0, False), timedelta(hours=3))
+        self.assertEqual(get_refresh_interval(timedelta(days=1), 5, True), timedelta(hours=3))
+
+    def test_no_refresh_after_start(self):
+        self.assertIsNone(get_refresh_interval(timedelta(0), 50, True))
+        self.assertIsNone(get_refresh_interval(timedelta(minutes=-10), 0, False))
+
+    def test_observed_sales_update_sold_rate(self):
+        now = timezone.now()
+        showtime = Showtime(datetime=get_showtimes_now() + timedelta(hours=6), sold=10,
+                            refreshed_on=now - timedelta(hours=1))
+        observe_sold(showtime, 50)
+        # The moving average of 40 seats sold in the last hour
+        self.assertAlmostEqual(showtime.sold_rate, 20, places=2)
+        self.assertEqual(showtime.sold, 50)
+        self.assertGreaterEqual(showtime.refreshed_on, now)
+        self.assertAlmostEqual(showtime.next_refresh_on - showtime.refreshed_on, timedelta(minutes=30),
+                               delta=timedelta(seconds=1))
+
+        showtime.datetime = get_showtimes_now() - timedelta(minutes=1)
+        observe_sold(showtime, 60)
+        self.assertIsNone(showtime.next_refresh_on)
+
+
+@override_settings(CACHES=TEST_CACHES, SHOWTIMES_REFRESH_BATCH_SIZE=2, SCRAPERS_LEASE_PENDING_TTL=600)
+class RefreshDueShowtimesTests(TestCase):
+
+    def setUp(self):
+        self.cinema_provider = create_cinema_provider(is_available=True)
+        self.movie = Movie.objects.create(name="Movie")
+
+    def create_showtime(self, external_id: str, starts_in: timedelta, next_refresh_in: timedelta,
+                        **kwargs) -> Showtime:
+        return Showtime.objects.create(
+            cinema_provider=kwargs.pop("cinema_provider", self.cinema_provider),
+            external_id=external_id,
+            movie=self.movie,
+            date_query=date(2030, 1, 1),
+            datetime=get_showtimes_now() + starts_in,
+            next_refresh_on=timezone.now() + next_refresh_in,
+            **kwargs
+        )
+
+    @mock.patch("cinemas.tasks.refresh_showtimes.delay")
+    def test_due_showtimes_are_dispatched_once(self, delay):
+        due = [self.create_showtime(str(i), timedelta(hours=2), timedelta(minutes=-i - 1)) for i in range(3)]
+        self.create_showtime("not due", timedelta(hours=2), timedelta(minutes=5))
+        self.create_showtime("started", timedelta(minutes=-5), timedelta(minutes=-5))
+        self.create_showtime("inactive", timedelta(hours=2), timedelta(minutes=-5), is_active=False)
+        unavailable_provider = create_cinema_provider(name="Unavailable")
+        self.create_showtime("unavailable", timedelta(hours=2), timedelta(minutes=-5),
+                             cinema_provider=unavailable_provider)
+
+        dispatched_refresh_on = {}
+
+        def dispatch(cinema_provider_pk, showtime_pks):
+            # The showtimes are pushed forward before the refresh task can be picked up by a worker
+            for showtime in Showtime.objects.filter(pk__in=showtime_pks):
+                dispatched_refresh_on[str(showtime.pk)] = showtime.next_refresh_on
+
+        delay.side_effect = dispatch
+        self.assertEqual(refresh_due_showtimes(), 3)
+
+        # The most overdue showtimes first, in batches of SHOWTIMES_REFRESH_BATCH_SIZE
+        self.assertEqual([call.args for call in delay.call_args_list], [
+            (str(self.cinema_provider.pk), [str(due[2].pk), str(due[1].pk)]),
+            (str(self.cinema_provider.pk), [str(due[0].pk)]),
+        ])
+        for showtime in due:
+            self.assertGreater(dispatched_refresh_on[str(showtime.pk)], timezone.now() + timedelta(minutes=9))
+
+        delay.reset_mock()
+        self.assertEqual(refresh_due_showtimes(), 0)
+        delay.assert_not_called()
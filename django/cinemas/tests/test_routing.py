@@ -0,0 +1,46 @@
+import uuid
+from datetime import date
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from cinemas.routing import route_task
+from cinemas.tests.base import TEST_CACHES, create_cinema_provider
+
+
+@override_settings(CACHES=TEST_CACHES, SCRAPERS_QUEUE="scrape-io", SCRAPERS_INGEST_QUEUE="ingest")
+class RouteTaskTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cinema_provider = create_cinema_provider(queue="novo")
+
+    def test_scraper_tasks_go_to_provider_queue(self):
+        cinema_provider_pk = str(self.cinema_provider.pk)
+        self.assertEqual(route_task("cinemas.tasks.scan_cinema", (cinema_provider_pk, date(2030, 1, 1)), {}, {}),
+                         {"queue": "novo"})
+        self.assertEqual(route_task("cinemas.tasks.scan_cinemas", ([[cinema_provider_pk, []]],), {}, {}),
+                         {"queue": "novo"})
+        self.assertEqual(route_task("cinemas.tasks.scan_shard", (), {"cinema_provider_pk": str(uuid.uuid4())}, {}),
+                         {"queue": "scrape-io"})
+        self.assertEqual(route_task("cinemas.tasks.finish_shards", ([],), {}, {}), {"queue": "ingest"})
+        self.assertIsNone(route_task("cinemas.tasks.admit_scrapers", (), {}, {}))
+
+    def test_queue_is_read_from_provider_cache(self):
+        cinema_provider_pk = str(self.cinema_provider.pk)
+        route_task("cinemas.tasks.scan_cinema", (cinema_provider_pk,), {}, {})
+        with self.assertNumQueries(0):
+            self.assertEqual(route_task("cinemas.tasks.scan_cinema", (cinema_provider_pk,), {}, {}),
+                             {"queue": "novo"})
+
+        # The cache is reset when the provider is saved
+        self.cinema_provider.queue = ""
+        self.cinema_provider.save()
+        self.assertEqual(route_task("cinemas.tasks.scan_cinema", (cinema_provider_pk,), {}, {}),
+                         {"queue": "scrape-io"})
+
+    def test_entries_of_older_cache_version_are_not_read(self):
+        cinema_provider_pk = str(self.cinema_provider.pk)
+        # Entries cached before the queue was added
+        cache.set(f"scraper_status:provider:{cinema_provider_pk}", {"name": "Novo Cinemas"})
+        self.assertEqual(route_task("cinemas.tasks.scan_cinema", (cinema_provider_pk,), {}, {}), {"queue": "novo"})
@@ -0,0 +1,192 @@
+import json
+import uuid
+from datetime import date, timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from cinemas.constants import Freshness, ScraperStatus, ScraperTaskStatus
+from cinemas.locks import ScraperLease
+from cinemas.models import ScraperTask
+from cinemas.status import get_freshness, get_scraper_states, set_task_progress
+from cinemas.tasks import finish_tasks
+from cinemas.tests.base import TEST_CACHES, RedisTestMixin, create_cinema_provider
+
+
+@override_settings(CACHES=TEST_CACHES, SCRAPERS_CACHE_TIME=60, SCRAPERS_MAX_AGE=600)
+class StatusFreshnessTests(RedisTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cinema_provider = create_cinema_provider()
+        self.date_query = date(2030, 1, 1)
+
+    def test_freshness(self):
+        self.assertEqual(get_freshness({}, timedelta(seconds=30)), Freshness.FRESH)
+        self.assertEqual(get_freshness({}, timedelta(seconds=300)), Freshness.STALE)
+        self.assertEqual(get_freshness({}, timedelta(seconds=900)), Freshness.EXPIRED)
+        self.assertEqual(get_freshness({"cache_time": 600, "max_age": 1200}, timedelta(seconds=300)), Freshness.FRESH)
+
+    def create_task(self, age: int, status: ScraperTaskStatus = ScraperTaskStatus.FINISHED) -> ScraperTask:
+        task = ScraperTask.objects.create(cinema_provider=self.cinema_provider, date_query=self.date_query,
+                                          status=status)
+        ScraperTask.objects.filter(pk=task.pk).update(created_on=timezone.now() - timedelta(seconds=age))
+        task.refresh_from_db()
+        return task
+
+    def get_status(self, cinema_id=None, date_str="2030-01-01"):
+        return self.client.post(reverse("get_scraper_status"), {
+            "cinema_id": cinema_id or str(self.cinema_provider.pk),
+            "date": date_str,
+        })
+
+    @mock.patch("cinemas.views.start_scraper")
+    def test_fresh_data_is_served(self, start_scraper):
+        task = self.create_task(30)
+        response = self.get_status()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], ScraperStatus.AVAILABLE.name)
+        self.assertEqual(response.json()["task_id"], str(task.pk))
+        self.assertFalse(response.json()["stale"])
+        start_scraper.assert_not_called()
+
+    @mock.patch("cinemas.views.start_scraper")
+    def test_stale_data_is_served_while_refreshed(self, start_scraper):
+        self.create_task(300)
+        response = self.get_status()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["stale"])
+        start_scraper.assert_called_once_with(str(self.cinema_provider.pk), self.date_query)
+
+    @mock.patch("cinemas.views.start_scraper")
+    def test_expired_data_waits_for_new_run(self, start_scraper):
+        self.create_task(900)
+        response = self.get_status()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], ScraperStatus.IN_PROGRESS.name)
+        start_scraper.assert_called_once_with(str(self.cinema_provider.pk), self.date_query)
+
+    @mock.patch("cinemas.views.start_scraper")
+    def test_running_scraper_is_not_started_again(self, start_scraper):
+        ScraperLease(str(self.cinema_provider.pk), self.date_query).acquire()
+        response = self.get_status()
+        self.assertEqual(response.status_code, 202)
+        start_scraper.assert_not_called()
+
+    @mock.patch("cinemas.views.start_scraper")
+    def test_failed_run_keeps_previous_data(self, start_scraper):
+        task = self.create_task(300)
+        failed_task = self.create_task(0, ScraperTaskStatus.RUNNING)
+        finish_tasks([failed_task], ScraperTaskStatus.FAILED)
+
+        pair = (str(self.cinema_provider.pk), self.date_query)
+        self.assertEqual(get_scraper_states([pair])[pair].task_id, str(task.pk))
+        response = self.get_status()
+        self.assertEqual(response.json()["task_id"], str(task.pk))
+        self.assertTrue(response.json()["stale"])
+        # The failed run is retried by the next stale hit
+        start_scraper.assert_called_once_with(str(self.cinema_provider.pk), self.date_query)
+
+    @mock.patch("cinemas.views.start_scraper")
+    def test_failed_run_is_not_served(self, start_scraper):
+        self.create_task(0, ScraperTaskStatus.FAILED)
+        response = self.get_status()
+        self.assertEqual(response.status_code, 202)
+        start_scraper.assert_called_once_with(str(self.cinema_provider.pk), self.date_query)
+
+    def test_finished_run_replaces_cached_task(self):
+        pair = (str(self.cinema_provider.pk), self.date_query)
+        self.create_task(300)
+        get_scraper_states([pair])
+        task = self.create_task(0, ScraperTaskStatus.RUNNING)
+        finish_tasks([task], ScraperTaskStatus.FINISHED)
+        self.assertEqual(get_scraper_states([pair])[pair].task_id, str(task.pk))
+
+    def test_invalid_request(self):
+        self.assertEqual(self.get_status(cinema_id="unknown").status_code, 400)
+        self.assertEqual(self.get_status(date_str="01.01.2030").status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES, SCRAPERS_CACHE_TIME=60, SCRAPERS_MAX_AGE=600)
+class StatusBatchTests(RedisTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cinema_providers = [create_cinema_provider(name=f"Provider {i}") for i in range(3)]
+
+    def create_task(self, cinema_provider, date_query: date, age: int,
+                    status: ScraperTaskStatus = ScraperTaskStatus.FINISHED) -> ScraperTask:
+        task = ScraperTask.objects.create(cinema_provider=cinema_provider, date_query=date_query, status=status)
+        ScraperTask.objects.filter(pk=task.pk).update(created_on=timezone.now() - timedelta(seconds=age))
+        return task
+
+    def get_statuses(self, items):
+        return self.client.post(reverse("get_scraper_status_batch"), json.dumps({"items": items}),
+                                content_type="application/json")
+
+    @mock.patch("cinemas.views.start_scrapers")
+    def test_mixed_states(self, start_scrapers):
+        fresh, expired, running = self.cinema_providers
+        task = self.create_task(fresh, date(2030, 1, 1), 30)
+        self.create_task(expired, date(2030, 1, 1), 900)
+        running_task = self.create_task(running, date(2030, 1, 1), 0, ScraperTaskStatus.RUNNING)
+        ScraperTask.objects.filter(pk=running_task.pk).update(saved_count=5, showtimes_count=10)
+        running_task.refresh_from_db()
+        ScraperLease(str(running.pk), date(2030, 1, 1)).acquire()
+        set_task_progress(running_task)
+        unknown = str(uuid.uuid4())
+
+        response = self.get_statuses([
+            {"cinema_id": str(fresh.pk), "date": "2030-01-01"},
+            {"cinema_id": str(expired.pk), "date": "2030-01-01"},
+            {"cinema_id": str(running.pk), "date": "2030-01-01"},
+            {"cinema_id": str(fresh.pk), "date": "2030-01-02"},
+            {"cinema_id": unknown, "date": "2030-01-01"},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = {(result["cinema_id"], result["date"]): result for result in response.json()["results"]}
+        self.assertEqual(results[(str(fresh.pk), "2030-01-01")]["status"], ScraperStatus.AVAILABLE.name)
+        self.assertEqual(results[(str(fresh.pk), "2030-01-01")]["task_id"], str(task.pk))
+        self.assertEqual(results[(str(expired.pk), "2030-01-01")]["status"], ScraperStatus.IN_PROGRESS.name)
+        self.assertEqual(results[(str(running.pk), "2030-01-01")]["status"], ScraperStatus.PARTIAL.name)
+        self.assertEqual(results[(str(running.pk), "2030-01-01")]["saved"], 5)
+        self.assertEqual(results[(str(fresh.pk), "2030-01-02")]["status"], ScraperStatus.IN_PROGRESS.name)
+        self.assertEqual(results[(unknown, "2030-01-01")]["status"], "NOT_FOUND")
+        # The pairs without usable data are started together, the running one is not started again
+        start_scrapers.assert_called_once_with([
+            (str(expired.pk), date(2030, 1, 1)),
+            (str(fresh.pk), date(2030, 1, 2)),
+        ])
+
+    @mock.patch("cinemas.views.start_scrapers")
+    def test_duplicate_pairs_are_answered_once(self, start_scrapers):
+        item = {"cinema_id": str(self.cinema_providers[0].pk), "date": "2030-01-01"}
+        response = self.get_statuses([item, item, dict(item, cinema_id=item["cinema_id"].upper())])
+        self.assertEqual(len(response.json()["results"]), 1)
+        start_scrapers.assert_called_once_with([(str(self.cinema_providers[0].pk), date(2030, 1, 1))])
+
+    @mock.patch("cinemas.views.start_scrapers")
+    def test_invalid_request(self, start_scrapers):
+        cinema_id = str(self.cinema_providers[0].pk)
+        for body in ["{", "[]", json.dumps({}), json.dumps({"items": [{"cinema_id": cinema_id}]}),
+                     json.dumps({"items": [{"cinema_id": "unknown", "date": "2030-01-01"}]}),
+                     json.dumps({"items": [{"cinema_id": cinema_id, "date": "01.01.2030"}]})]:
+            response = self.client.post(reverse("get_scraper_status_batch"), body, content_type="application/json")
+            self.assertEqual(response.status_code, 400, body)
+        start_scrapers.assert_not_called()
+
+    def test_states_are_read_with_one_query_per_model(self):
+        pairs = []
+        for cinema_provider in self.cinema_providers:
+            for day in range(1, 4):
+                self.create_task(cinema_provider, date(2030, 1, day), 30)
+                pairs.append((str(cinema_provider.pk), date(2030, 1, day)))
+
+        # The providers and the last tasks of all pairs missing from the cache
+        with self.assertNumQueries(2):
+            states = get_scraper_states(pairs)
+        self.assertTrue(all(state.task_id for state in states.values()))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_scraper_states(pairs), states)
@@ -0,0 +1,79 @@
+from datetime import date
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TransactionTestCase, override_settings
+
+from cinemas.constants import ScraperTaskStatus
+from cinemas.locks import ScraperLease
+from cinemas.models import ScraperTask, ShowtimeSeats
+from cinemas.refresh import RefreshedSeats
+from cinemas.runtime import runtime
+from cinemas.tasks import scan_cinema_dates
+from cinemas.tests.base import TEST_CACHES, RedisTestMixin, create_cinema_provider, create_discovered
+from config.celery import app
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ChordModeTests(RedisTestMixin, TransactionTestCase):
+    """
+    Distributed runs with the shards and the chord callback executed in place by the eager mode of celery.
+    The shards save the seats from the runtime loop thread, so the test data is committed.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # CELERY_TASK_ALWAYS_EAGER is read by the celery app once, so the configuration of the app is changed
+        eager = {"task_always_eager": True, "task_eager_propagates": True}
+        self.addCleanup(app.conf.update, {name: app.conf[name] for name in eager})
+        app.conf.update(eager)
+        self.addCleanup(runtime.shutdown)
+        self.cinema_provider = create_cinema_provider(shard_size=2)
+        self.date_query = date(2030, 1, 1)
+        self.shards = []
+        self.failing = set()
+        self.scraper_module = SimpleNamespace(
+            discover_showtimes=lambda dates: {
+                date_query: [create_discovered(str(i), hour=10 + i) for i in range(5)] for date_query in dates
+            },
+            stream_showtimes=self.stream_showtimes
+        )
+        patcher = mock.patch("cinemas.tasks.get_scraper_module", return_value=self.scraper_module)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def stream_showtimes(self, showtimes):
+        self.shards.append([showtime.external_id for showtime in showtimes])
+        for showtime in showtimes:
+            if showtime.external_id in self.failing:
+                raise RuntimeError("Seats page failed")
+            yield showtime, [RefreshedSeats(area="Standard", all=100, sold=10, price=50)]
+
+    def scan(self) -> ScraperTask:
+        self.assertEqual(scan_cinema_dates(str(self.cinema_provider.pk), [self.date_query]), [self.date_query])
+        return ScraperTask.objects.get(cinema_provider=self.cinema_provider, date_query=self.date_query)
+
+    def test_shards_cover_pending_showtimes(self):
+        task = self.scan()
+
+        # Every pending showtime is requested by exactly one shard, in the order of the showtimes
+        self.assertEqual(self.shards, [["0", "1"], ["2", "3"], ["4"]])
+        self.assertEqual(task.status, ScraperTaskStatus.FINISHED)
+        self.assertEqual(task.showtimes_count, 5)
+        self.assertEqual(task.completed_showtimes.count(), 5)
+        self.assertEqual(ShowtimeSeats.objects.filter(task=task).count(), 5)
+        # The statistics of the discovery are merged with the statistics of the shards by the callback
+        self.assertIn("discovery", task.stats["stages"])
+        self.assertIn("seats", task.stats["stages"])
+        self.assertEqual(task.stats["rows"], 5)
+        self.assertTrue(ScraperLease(str(self.cinema_provider.pk), self.date_query).acquire())
+
+    def test_failed_shard_releases_leases(self):
+        self.failing = {"2"}
+        task = self.scan()
+
+        self.assertEqual(len(self.shards), 3)
+        self.assertEqual(task.status, ScraperTaskStatus.FINISHED)
+        # The other shards are saved, the tasks are finished with their seats
+        self.assertEqual(set(task.completed_showtimes.values_list("external_id", flat=True)), {"0", "1", "4"})
+        self.assertTrue(ScraperLease(str(self.cinema_provider.pk), self.date_query).acquire())
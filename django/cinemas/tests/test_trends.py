@@ -0,0 +1,71 @@
+import uuid
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cinemas.constants import ScraperTaskStatus
+from cinemas.models import CinemaProvider, ScraperTask
+from cinemas.tests.base import TEST_CACHES, create_cinema_provider
+from cinemas.trends import get_providers_finished_tasks
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TrendsTests(TestCase):
+
+    def create_run(self, cinema_provider: CinemaProvider, started_on, duration: int, days: int = 1):
+        run = uuid.uuid4().hex
+        for day in range(days):
+            ScraperTask.objects.create(
+                cinema_provider=cinema_provider,
+                date_query=date(2030, 1, 1 + day),
+                status=ScraperTaskStatus.FINISHED,
+                started_on=started_on + timedelta(seconds=day),
+                finished_on=started_on + timedelta(seconds=duration),
+                stats={"run": run, "rows": 10}
+            )
+
+    def test_runs_of_all_providers_are_loaded_together(self):
+        now = timezone.now()
+        first, second = create_cinema_provider(name="First"), create_cinema_provider(name="Second")
+        for i in range(4):
+            self.create_run(first, now - timedelta(hours=4 - i), 60 + i, days=2)
+        self.create_run(second, now, 30)
+        ScraperTask.objects.create(cinema_provider=second, date_query=date(2030, 1, 1),
+                                   status=ScraperTaskStatus.FAILED, started_on=now, finished_on=now)
+
+        with self.assertNumQueries(1):
+            providers_tasks = get_providers_finished_tasks([first, second], limit=3)
+        # The last runs in the order of their start, every run once with all its dates and rows
+        self.assertEqual([task.duration for task in providers_tasks[first.pk]], [61, 62, 63])
+        self.assertEqual(providers_tasks[first.pk][0].dates, [date(2030, 1, 1), date(2030, 1, 2)])
+        self.assertEqual(providers_tasks[first.pk][0].stats["rows"], 20)
+        self.assertEqual([task.duration for task in providers_tasks[second.pk]], [30])
+
+    def test_changelist_trend_queries_do_not_grow_with_providers(self):
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(user)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse("admin:cinemas_cinemaprovider_changelist"))
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        cinema_provider = create_cinema_provider(name="First")
+        self.create_run(cinema_provider, timezone.now() - timedelta(hours=1), 60)
+        # The first request also fills the caches of the admin, e.g. the content types
+        count_queries()
+        queries = count_queries()
+        for i in range(3):
+            cinema_provider = create_cinema_provider(name=f"Provider {i}")
+            self.create_run(cinema_provider, timezone.now() - timedelta(hours=1), 60)
+        self.assertEqual(count_queries(), queries)
+
+        response = self.client.get(reverse("admin:cinemas_cinemaprovider_trends", args=[cinema_provider.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["tasks"]), 1)
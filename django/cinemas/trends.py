@@ -0,0 +1,78 @@
+import statistics
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from django.db.models import F, Window
+from django.db.models.functions import DenseRank
+
+from cinemas.constants import ScraperTaskStatus
+from cinemas.models import CinemaProvider, ScraperTask
+
+# The median duration of the recent runs is compared with the median of the runs before them
+RECENT_RUNS = 5
+BASELINE_RUNS = 30
+# Recent runs this number of times slower than before are marked as a regression in the admin panel
+REGRESSION_RATIO = 2.0
+
+
+def get_providers_finished_tasks(cinema_providers: List[CinemaProvider], limit: int = RECENT_RUNS + BASELINE_RUNS
+                                 ) -> Dict[UUID, List[ScraperTask]]:
+    """
+    Returns the last finished scraper runs with statistics of every cinema provider with a single query, in the order
+    of their start. The ScraperTasks of all dates of a run share its statistics, so a run is returned once, as its first
+    task with the dates and the written rows of all its tasks.
+    """
+    tasks = ScraperTask.objects.filter(
+        cinema_provider__in=cinema_providers,
+        status=ScraperTaskStatus.FINISHED,
+        started_on__isnull=False,
+        finished_on__isnull=False
+    ).annotate(
+        # The tasks of a run are finished together, see cinemas.tasks.finish_tasks
+        run_rank=Window(DenseRank(), partition_by=F("cinema_provider_id"), order_by=F("finished_on").desc())
+    ).filter(run_rank__lte=limit).order_by("cinema_provider_id", "-started_on")
+    providers_runs = {cinema_provider.pk: {} for cinema_provider in cinema_providers}
+    for task in tasks:
+        runs = providers_runs[task.cinema_provider_id]
+        # Statistics saved before the run id was added belong to single tasks
+        run = task.stats.get("run") or task.pk
+        if run in runs:
+            first_task = runs[run]
+            first_task.started_on = min(first_task.started_on, task.started_on)
+            first_task.dates.insert(0, task.date_query)
+            first_task.stats["rows"] = first_task.stats.get("rows", 0) + task.stats.get("rows", 0)
+            continue
+        if len(runs) == limit:
+            continue
+        task.dates = [task.date_query]
+        runs[run] = task
+    return {pk: list(reversed(runs.values())) for pk, runs in providers_runs.items()}
+
+
+def get_finished_tasks(cinema_provider: CinemaProvider, limit: int = RECENT_RUNS + BASELINE_RUNS
+                       ) -> List[ScraperTask]:
+    return get_providers_finished_tasks([cinema_provider], limit)[cinema_provider.pk]
+
+
+def get_slowdown(durations: List[float]) -> Optional[float]:
+    """
+    Ratio of the median duration of the recent runs to the median duration of the runs before them,
+    None if there are not enough runs
+    """
+    if len(durations) < RECENT_RUNS * 2:
+        return None
+    baseline = statistics.median(durations[-RECENT_RUNS - BASELINE_RUNS:-RECENT_RUNS])
+    if not baseline:
+        return None
+    return statistics.median(durations[-RECENT_RUNS:]) / baseline
+
+
+def get_chart_points(values: List[float], width: int, height: int) -> str:
+    """
+    Points of the SVG polyline of the values, the highest value is at the top of the chart
+    """
+    if not values:
+        return ""
+    top = max(values) or 1
+    step = width / max(len(values) - 1, 1)
+    return " ".join(f"{i * step:.1f},{height - value / top * height:.1f}" for i, value in enumerate(values))
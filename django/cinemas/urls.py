@@ -2,11 +2,12 @@ from django.urls import path
 
 from cinemas.views import (
     MainTemplateView,
-    GetScraperStatusView, CSVDownloadView,
+    GetScraperStatusView, GetScraperStatusBatchView, CSVDownloadView,
 )
 
 urlpatterns = [
     path("", MainTemplateView.as_view(), name="main"),
     path("get_scraper_status", GetScraperStatusView.as_view(), name="get_scraper_status"),
+    path("get_scraper_status_batch", GetScraperStatusBatchView.as_view(), name="get_scraper_status_batch"),
     path("get_csv/<uuid:pk>", CSVDownloadView.as_view(), name="get_csv")
 ]
@@ -1,16 +1,22 @@
 import csv
+import json
+import uuid
 from datetime import datetime
+from typing import Tuple
 
-from django.conf import settings
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, Http404
 from django.utils import timezone
 from django.views import View
 from django.views.generic import TemplateView
 
-from cinemas.constants import ScraperStatus
+from cinemas.constants import Freshness, ScraperStatus
 from cinemas.forms import StartScraperForm
-from cinemas.models import CinemaProvider, ScraperTask, ShowtimeSeats
-from cinemas.tasks import scan_cinema
+from cinemas.models import CinemaProvider, ScraperTask
+from cinemas.refresh import get_current_seats
+from cinemas.status import ScraperState, get_freshness, get_scraper_states
+from cinemas.tasks import start_scraper, start_scrapers
+from common.metrics import EXPORT_ROWS, EXPORT_SECONDS, STATUS_POLLS
+from common.tracing import start_span
 
 
 class MainTemplateView(TemplateView):
@@ -28,32 +34,108 @@ class GetScraperStatusView(View):
     def post(self, request, *args, **kwargs):
         cinema_pk = self.request.POST.get('cinema_id')
         date_str = self.request.POST.get('date')
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-        cinema_provider_obj = CinemaProvider.objects.get(pk=cinema_pk)
-        last_task = ScraperTask.objects.filter(cinema_provider=cinema_provider_obj, date_query=date_obj).order_by("created_on").last()
-
-        if cinema_provider_obj.scraper_status == ScraperStatus.IN_PROGRESS:
-            return JsonResponse({"status": ScraperStatus.IN_PROGRESS.name}, status=202)
-        if not last_task:
-            self.run_scraper(cinema_provider_obj, date_obj)
-            return JsonResponse({"status": ScraperStatus.IN_PROGRESS.name}, status=202)
-
-        last_scan_on = last_task.created_on
-        now = timezone.now()
-        timedelta_ = now - last_scan_on
-        if timedelta_.seconds > settings.SCRAPERS_CACHE_TIME:
-            self.run_scraper(cinema_provider_obj, date_obj)
-            return JsonResponse({"status": ScraperStatus.IN_PROGRESS.name}, status=202)
-        return JsonResponse({"status": ScraperStatus.AVAILABLE.name, "task_id": last_task.pk}, status=200)
-
-    def run_scraper(self, cinema_obj: CinemaProvider, date: datetime.date):
-        cinema_obj.scraper_status = ScraperStatus.IN_PROGRESS
-        cinema_obj.save()
-        scan_cinema.delay(cinema_obj.pk, date)
+        try:
+            pair = (str(uuid.UUID(cinema_pk)), datetime.strptime(date_str, "%Y-%m-%d").date())
+        except (ValueError, TypeError):
+            return JsonResponse({"error": "Invalid request body"}, status=400)
+        # The scraper run started by the request continues its trace, see cinemas.tasks.scan_cinema_dates
+        with start_span("get_scraper_status", cinema_provider=pair[0], date=date_str) as span:
+            state = get_scraper_states([pair])[pair]
+            if state.provider is None:
+                raise Http404("Cinema provider not found")
+
+            result = self.get_status(pair, state)
+            span.set_attribute("status", result["status"])
+        STATUS_POLLS.labels("single", result["status"]).inc()
+        if result["status"] in (ScraperStatus.QUEUED.name, ScraperStatus.IN_PROGRESS.name, ScraperStatus.PARTIAL.name):
+            return JsonResponse(result, status=202)
+        return JsonResponse(result, status=200)
+
+    def get_status(self, pair: Tuple[str, datetime.date], state: ScraperState) -> dict:
+        if not state.task_id:
+            if not state.in_progress:
+                self.run_scraper(*pair)
+            return self.get_in_progress_status(state)
+
+        age = timezone.now() - state.task_created_on
+        freshness = get_freshness(state.provider, age)
+        if freshness == Freshness.EXPIRED:
+            if not state.in_progress:
+                self.run_scraper(*pair)
+            return self.get_in_progress_status(state)
+        # Stale data is served immediately while the new scraper run refreshes it in the background
+        if freshness == Freshness.STALE and not state.in_progress:
+            self.run_scraper(*pair)
+        return {
+            "status": ScraperStatus.AVAILABLE.name,
+            "task_id": state.task_id,
+            "age": int(age.total_seconds()),
+            "stale": freshness != Freshness.FRESH,
+        }
+
+    def get_in_progress_status(self, state: ScraperState) -> dict:
+        # Seats already saved by the running scraper can be downloaded before it finishes
+        if state.in_progress and state.partial and state.partial["saved"]:
+            return {
+                "status": ScraperStatus.PARTIAL.name,
+                "task_id": state.partial["task_id"],
+                "saved": state.partial["saved"],
+                "total": state.partial["total"],
+            }
+        # The run waits for a free slot, see cinemas.admission
+        if state.in_progress and state.queued:
+            return {
+                "status": ScraperStatus.QUEUED.name,
+                "position": state.queued["position"],
+                "wait": state.queued["wait"],
+            }
+        return {"status": ScraperStatus.IN_PROGRESS.name}
+
+    def run_scraper(self, cinema_pk: str, date: datetime.date):
+        start_scraper(cinema_pk, date)
+
+
+class GetScraperStatusBatchView(GetScraperStatusView):
+    """
+    Accepts a JSON body {"items": [{"cinema_id": ..., "date": "YYYY-MM-DD"}, ...]}
+    and answers the status of every pair with a single cache round trip.
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            items = json.loads(request.body)["items"]
+            pairs = [
+                (str(uuid.UUID(item["cinema_id"])), datetime.strptime(item["date"], "%Y-%m-%d").date())
+                for item in items
+            ]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({"error": "Invalid request body"}, status=400)
+
+        with start_span("get_scraper_status_batch", items=len(pairs)):
+            states = get_scraper_states(pairs)
+            # Scrapers of all requested pairs are started together by one task, see run_scraper
+            self.pairs_to_start = []
+            results = []
+            for pair in dict.fromkeys(pairs):
+                state = states[pair]
+                if state.provider is None:
+                    result = {"status": "NOT_FOUND"}
+                else:
+                    result = self.get_status(pair, state)
+                STATUS_POLLS.labels("batch", result["status"]).inc()
+                result.update({"cinema_id": pair[0], "date": pair[1].strftime("%Y-%m-%d")})
+                results.append(result)
+            if self.pairs_to_start:
+                start_scrapers(self.pairs_to_start)
+        return JsonResponse({"results": results}, status=200)
+
+    def run_scraper(self, cinema_pk: str, date: datetime.date):
+        self.pairs_to_start.append((cinema_pk, date))
 
 
 class CSVDownloadView(View):
 
+    @EXPORT_SECONDS.time()
     def get(self, *args, **kwargs):
         task_id = self.kwargs['pk']
         task = ScraperTask.objects.get(id=task_id)
@@ -63,7 +145,7 @@ class CSVDownloadView(View):
             headers={"Content-Disposition": f'attachment; filename="{filename}"'},
         )
 
-        seats = ShowtimeSeats.objects.filter(task=task)
+        seats = get_current_seats(task)
         headers = [
             "Country",
             "Movie",
@@ -95,6 +177,7 @@ class CSVDownloadView(View):
                 seat_obj.created_on.strftime("%d %B %H:%M"),
                 seat_obj.movie.language,
             ])
+        EXPORT_ROWS.inc(len(seats))
         return response
 
 
@@ -0,0 +1,91 @@
+import atexit
+import json
+import logging
+import logging.config
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Optional
+
+from django.conf import settings
+from opentelemetry import trace
+
+# Attributes of every record, other attributes are the extra fields of the record
+STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Writes the record as a JSON line together with its extra fields, e.g. logger.info(..., extra={"url": url})
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        data.update((key, value) for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES)
+        return json.dumps(data, default=str)
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Puts the records into the queue of the writer thread, the current trace is added to them before,
+    since the writer thread does not see it
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        span_context = trace.get_current_span().get_span_context()
+        if span_context.is_valid:
+            record.trace_id = format(span_context.trace_id, "032x")
+            record.span_id = format(span_context.span_id, "016x")
+        return super().prepare(record)
+
+
+def start_listener(queue_handler: QueueHandler, handlers: List[logging.Handler]):
+    global listener
+    queue_handler.queue = queue.SimpleQueue()
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+
+def stop_listener():
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def configure_logging(config: dict):
+    """
+    LOGGING_CONFIG of Django. The handlers of the root logger are moved to a writer thread, so the event loop
+    and the request threads only put the records into a queue and never wait for the stream.
+    """
+    logging.config.dictConfig(config)
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    if not handlers:
+        return
+    for handler in handlers:
+        root.removeHandler(handler)
+    queue_handler = ContextQueueHandler(queue.SimpleQueue())
+    root.addHandler(queue_handler)
+    start_listener(queue_handler, handlers)
+    # The writer thread does not survive the fork of the gunicorn and celery pool processes
+    os.register_at_fork(after_in_child=lambda: start_listener(queue_handler, handlers))
+    atexit.register(stop_listener)
+
+
+def is_sampled(logger: logging.Logger, level: int = logging.DEBUG) -> bool:
+    """
+    Hot paths write only a sample of their records, see SCRAPERS_LOG_SAMPLE_RATE.
+    The level is checked first, so a disabled record costs neither the sampling nor the formatting.
+    """
+    return logger.isEnabledFor(level) and random.random() < settings.SCRAPERS_LOG_SAMPLE_RATE
@@ -0,0 +1,97 @@
+import os
+import re
+import time
+from functools import wraps
+from typing import Callable, TypeVar
+
+import yarl
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY
+from prometheus_client import multiprocess
+
+from common.tracing import start_span
+
+F = TypeVar("F", bound=Callable)
+
+# With PROMETHEUS_MULTIPROC_DIR set, every process of gunicorn and of the celery pool writes its metrics into files of
+# this directory, and the metrics endpoint of the container sums them, see get_registry
+SCRAPER_HTTP_REQUEST_SECONDS = Histogram(
+    "scraper_http_request_seconds",
+    "Requests of the scrapers to the cinema provider sites",
+    ["host", "endpoint"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+SCRAPER_HTTP_IN_FLIGHT = Gauge(
+    "scraper_http_requests_in_flight",
+    "Requests of the scrapers waiting for the response",
+    ["host"],
+    multiprocess_mode="livesum"
+)
+SCRAPER_HTTP_RETRIES = Counter("scraper_http_retries", "Retried requests of the scrapers", ["host"])
+SCRAPER_HTTP_ERRORS = Counter(
+    "scraper_http_errors",
+    "Failed attempts of the scraper requests by the response status or the error name",
+    ["host", "reason"]
+)
+SCRAPER_STAGE_SECONDS = Histogram(
+    "scraper_stage_seconds",
+    "Calls of the list_movies, list_showtimes and fetch_seats stages of the scrapers",
+    ["scraper", "stage"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+SCRAPER_PARSE_SECONDS = Histogram(
+    "scraper_parse_seconds",
+    "Parser functions of the scrapers, see timed_parser",
+    ["function"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+SCRAPER_LOOP_LAG_SECONDS = Histogram(
+    "scraper_loop_lag_seconds",
+    "Delay of the callbacks scheduled in the event loop of the workers, see cinemas.loopmonitor",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+SCRAPER_LOOP_BLOCKS = Counter(
+    "scraper_loop_blocks",
+    "Callbacks blocking the event loop of the workers longer than SCRAPERS_LOOP_BLOCK_THRESHOLD"
+)
+INGESTED_ROWS = Counter("ingested_rows", "Seats rows saved by the scrapers", ["cinema_provider"])
+INGEST_BATCH_SECONDS = Histogram("ingest_batch_seconds", "Transactions of the saved seats batches")
+STATUS_POLLS = Counter("status_polls", "Scraper statuses answered by the status views", ["view", "status"])
+EXPORT_SECONDS = Histogram(
+    "export_seconds",
+    "Generation of the CSV files",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+EXPORT_ROWS = Counter("export_rows", "Rows of the generated CSV files")
+
+# Ids in the paths of the sites, e.g. /movies/1234 or /showtimes/<uuid>, are replaced to keep the number of series low
+ENDPOINT_ID = re.compile(r"/[0-9a-fA-F-]*\d[0-9a-fA-F-]*(?=/|$)")
+
+
+def get_endpoint(url: str) -> str:
+    return ENDPOINT_ID.sub("/:id", yarl.URL(url).path) or "/"
+
+
+def get_registry() -> CollectorRegistry:
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def timed_parser(function: F) -> F:
+    """
+    Observes the time of the parser function in scraper_parse_seconds and traces it
+    """
+    name = f"{function.__module__}.{function.__qualname__}"
+    histogram = SCRAPER_PARSE_SECONDS.labels(name)
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with start_span(f"parse {function.__qualname__}"):
+                return function(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
@@ -0,0 +1,86 @@
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from django.conf import settings
+from opentelemetry import context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+# Spans are not recorded until setup_tracing is called, the tracer is a cheap no-op then
+tracer = trace.get_tracer("cinemas")
+# Spans of the celery tasks running in the process by the task id, see start_task_span
+task_spans: Dict[str, tuple] = {}
+configured = False
+
+
+def setup_tracing(service_name: str):
+    """
+    Installs the tracer provider of the process, see TRACING_EXPORTER. The exporter thread is restarted
+    in the processes forked by gunicorn and celery.
+    """
+    global configured
+    if configured or not settings.TRACING_EXPORTER:
+        return
+    if settings.TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    else:
+        exporter = ConsoleSpanExporter(
+            out=open(settings.TRACING_FILE, "a"),
+            formatter=lambda span: span.to_json(indent=None) + os.linesep
+        )
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        # Spans of the scraper runs follow the decision made for the status request
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATE))
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    configured = True
+
+
+def get_trace_context() -> Dict[str, str]:
+    """
+    Context of the current span to continue the trace in another process, e.g. in a celery message
+    """
+    carrier = {}
+    propagate.inject(carrier)
+    return carrier
+
+
+@contextmanager
+def start_span(name: str, parent: Optional[Dict[str, str]] = None, **attributes) -> Iterator[trace.Span]:
+    """
+    Span of the block, a child of the current span or of the span of the parent context from get_trace_context
+    """
+    links = []
+    parent_context = None
+    if parent:
+        parent_context = propagate.extract(parent)
+        # The span that received the parent context, e.g. the celery task, is linked to keep both ways
+        current_context = trace.get_current_span().get_span_context()
+        if current_context.is_valid:
+            links.append(trace.Link(current_context))
+    with tracer.start_as_current_span(name, context=parent_context, links=links,
+                                      attributes=attributes) as span:
+        yield span
+
+
+def start_task_span(task_id: str, task, headers: Dict[str, str]):
+    span = tracer.start_span(f"celery {task.name}", context=propagate.extract(headers),
+                             kind=trace.SpanKind.CONSUMER, attributes={"celery.task_id": task_id})
+    token = context.attach(trace.set_span_in_context(span))
+    task_spans[task_id] = (span, token)
+
+
+def end_task_span(task_id: str, state: Optional[str]):
+    if task_id not in task_spans:
+        return
+    span, token = task_spans.pop(task_id)
+    context.detach(token)
+    if state:
+        span.set_attribute("celery.state", state)
+    span.end()
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from common.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path("metrics", MetricsView.as_view(), name="metrics"),
     path("", include("cinemas.urls")),
 ]
\ No newline at end of file
@@ -1,3 +1,14 @@
-from django.shortcuts import render
+from django.http import HttpResponse
+from django.views import View
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-# Create your views here.
+from common.metrics import get_registry
+
+
+class MetricsView(View):
+    """
+    Prometheus metrics of all gunicorn workers of the container
+    """
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
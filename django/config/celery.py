@@ -1,6 +1,10 @@
 import os
 
 from celery import Celery
+from celery.signals import (
+    before_task_publish, task_postrun, task_prerun, worker_init, worker_process_shutdown, worker_shutdown
+)
+from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -15,3 +19,63 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
+
+
+@worker_init.connect
+def preload_scrapers(**kwargs):
+    # Scrapers are imported once in the main worker process and inherited by the pool processes
+    from cinemas.registry import preload_scrapers
+    preload_scrapers()
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    # Metrics of the pool processes are collected from the files of PROMETHEUS_MULTIPROC_DIR by the main process
+    if not settings.CELERY_METRICS_PORT:
+        return
+    from prometheus_client import start_http_server
+    from common.metrics import get_registry
+    start_http_server(settings.CELERY_METRICS_PORT, registry=get_registry())
+
+
+@worker_init.connect
+def setup_tracing(**kwargs):
+    from common.tracing import setup_tracing
+    setup_tracing("celery")
+
+
+@before_task_publish.connect
+def inject_trace_context(headers=None, **kwargs):
+    # The task continues the trace of the code that sent it, e.g. of the scraper status request
+    from common.tracing import get_trace_context
+    if headers is not None:
+        headers.update(get_trace_context())
+
+
+@task_prerun.connect
+def start_task_span(task_id=None, task=None, **kwargs):
+    from common.tracing import start_task_span
+    headers = {key: getattr(task.request, key, None) for key in ("traceparent", "tracestate")}
+    start_task_span(task_id, task, {key: value for key, value in headers.items() if value})
+
+
+@task_postrun.connect
+def end_task_span(task_id=None, state=None, **kwargs):
+    from common.tracing import end_task_span
+    end_task_span(task_id, state)
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    # Live gauges of the exited pool process are dropped
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def stop_runtime(**kwargs):
+    # Closes the shared connections of the scrapers and stops the event loop of the worker process
+    from cinemas.runtime import runtime
+    runtime.shutdown()
@@ -142,18 +142,132 @@ MEDIA_ROOT = '/var/www/app/media/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Level of the logs of the web app and the celery workers
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+# "json" writes every record as a JSON line with its extra fields and the current trace, "text" is easier to read
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+# Levels of single scrapers, e.g. "reelcinema=DEBUG,novocinemas=WARNING", other scrapers log at SCRAPERS_LOG_LEVEL
+SCRAPERS_LOG_LEVEL = os.environ.get("SCRAPERS_LOG_LEVEL", LOG_LEVEL)
+SCRAPERS_LOG_LEVELS = dict(
+    item.strip().split("=") for item in os.environ.get("SCRAPERS_LOG_LEVELS", "").split(",") if item.strip()
+)
+# Share of the debug records written by the hot paths of the scrapers, e.g. one record per request
+SCRAPERS_LOG_SAMPLE_RATE = float(os.environ.get("SCRAPERS_LOG_SAMPLE_RATE", 0.01))
+# The records are written by a separate thread, see common.logs.configure_logging
+LOGGING_CONFIG = "common.logs.configure_logging"
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "common.logs.JsonFormatter"},
+        "text": {"format": "[%(asctime)s: %(levelname)s/%(processName)s] %(name)s: %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": LOG_FORMAT},
+    },
+    "root": {"handlers": ["console"], "level": LOG_LEVEL},
+    "loggers": {
+        "scrapers": {"level": SCRAPERS_LOG_LEVEL},
+        **{f"scrapers.{name}": {"level": level} for name, level in SCRAPERS_LOG_LEVELS.items()},
+    },
+}
+
 # Celery settings
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_BROKER", "redis://redis:6379/0")
-CELERY_DEFAULT_QUEUE = 'normal'
-CELERY_DEFAULT_EXCHANGE = 'normal'
-CELERY_DEFAULT_ROUTING_KEY = 'normal'
+# Celery workers log through the LOGGING configuration instead of their own handlers
+CELERY_WORKER_HIJACK_ROOT_LOGGER = False
+# Scraper tasks are acknowledged after the run, so the broker redelivers a task not acknowledged in this time in
+# seconds. It must be longer than the longest run, a run of several dates takes several scraper sessions
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "visibility_timeout": int(os.environ.get("CELERY_VISIBILITY_TIMEOUT", 60*60*6)),
+}
+CELERY_TASK_DEFAULT_QUEUE = 'normal'
+CELERY_TASK_DEFAULT_EXCHANGE = 'normal'
+CELERY_TASK_DEFAULT_ROUTING_KEY = 'normal'
+# Scraping tasks are I/O bound and run on workers with the threads pool, finishing of distributed scraper runs writes
+# to the database only. Every queue can be scaled separately, a cinema provider can also have its own queue
+CELERY_TASK_ROUTES = ["cinemas.routing.route_task"]
+SCRAPERS_QUEUE = os.environ.get("SCRAPERS_QUEUE", "scrape-io")
+SCRAPERS_INGEST_QUEUE = os.environ.get("SCRAPERS_INGEST_QUEUE", "ingest")
+# Port of the Prometheus metrics endpoint of every celery worker, 0 disables it
+CELERY_METRICS_PORT = int(os.environ.get("CELERY_METRICS_PORT", 9100))
+CELERY_BEAT_SCHEDULE = {
+    "prewarm-scrapers": {
+        "task": "cinemas.tasks.prewarm_scrapers",
+        "schedule": 60,
+    },
+    "refresh-showtimes": {
+        "task": "cinemas.tasks.refresh_due_showtimes",
+        "schedule": 60,
+    },
+    "admit-scrapers": {
+        "task": "cinemas.tasks.admit_scrapers",
+        "schedule": 10,
+    },
+}
+
+# Redis used for locks and other coordination between the web app and celery workers
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/2")
+
+# Cache settings
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CACHE_LOCATION", "redis://redis:6379/1"),
+    }
+}
 
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 # Time since the last update during which scrapers take data from the cache in seconds
 SCRAPERS_CACHE_TIME = int(os.environ.get("SCRAPERS_CACHE_TIME", 60*5))
+# Older data is still served while a new scraper run refreshes it in the background. Data older than this time in
+# seconds is never served, users wait for the new scraper run
+SCRAPERS_MAX_AGE = int(os.environ.get("SCRAPERS_MAX_AGE", 60*60*6))
+# How long scraper statuses are kept in the cache in seconds. Scrapers refresh them after every run
+SCRAPERS_STATUS_CACHE_TIME = int(os.environ.get("SCRAPERS_STATUS_CACHE_TIME", 60*60*24))
+# Lifetime of the (cinema provider, date) scraper lease in seconds. A running scraper renews it every third of this time,
+# so the lease of a dead worker expires quickly
+SCRAPERS_LEASE_TTL = int(os.environ.get("SCRAPERS_LEASE_TTL", 60))
+# Lifetime of the lease while the scraper task is waiting in the celery queue in seconds
+SCRAPERS_LEASE_PENDING_TTL = int(os.environ.get("SCRAPERS_LEASE_PENDING_TTL", 60*30))
+# Scraper runs executed by all celery workers at the same time, 0 disables the limit. Other runs wait in the admission
+# queue in Redis in the order of the requests
+SCRAPERS_MAX_RUNS = int(os.environ.get("SCRAPERS_MAX_RUNS", 10))
+# Scraper runs of one cinema provider executed at the same time, 0 disables the limit. Waiting runs of a busy cinema
+# provider do not block the runs of the other cinema providers
+SCRAPERS_MAX_PROVIDER_RUNS = int(os.environ.get("SCRAPERS_MAX_PROVIDER_RUNS", 2))
+# Scrapers save received seats in batches of this number of showtimes or at least once in SCRAPERS_SAVE_INTERVAL
+# seconds, so partial results are available while the scraper is running
+SCRAPERS_SAVE_BATCH_SIZE = int(os.environ.get("SCRAPERS_SAVE_BATCH_SIZE", 20))
+SCRAPERS_SAVE_INTERVAL = int(os.environ.get("SCRAPERS_SAVE_INTERVAL", 5))
+# Requests per second to one host of a cinema provider from all celery workers together, 0 disables the limit.
+# The token buckets are kept in Redis, a worker takes SCRAPERS_RATE_LIMIT_PREFETCH tokens at once to save round trips
+SCRAPERS_RATE_LIMIT = float(os.environ.get("SCRAPERS_RATE_LIMIT", 20))
+SCRAPERS_RATE_LIMIT_BURST = int(os.environ.get("SCRAPERS_RATE_LIMIT_BURST", 20))
+SCRAPERS_RATE_LIMIT_PREFETCH = int(os.environ.get("SCRAPERS_RATE_LIMIT_PREFETCH", 5))
+# Celery workers run scrapers in one long-lived event loop per worker process, uvloop is used for it if installed
+SCRAPERS_UVLOOP = os.environ.get("SCRAPERS_UVLOOP", "True") == "True"
+# The lag of the worker event loop is measured every SCRAPERS_LOOP_MONITOR_INTERVAL seconds, callbacks blocking the loop
+# longer than SCRAPERS_LOOP_BLOCK_THRESHOLD seconds are logged with their stack, see cinemas.loopmonitor
+SCRAPERS_LOOP_MONITOR = os.environ.get("SCRAPERS_LOOP_MONITOR", "True") == "True"
+SCRAPERS_LOOP_MONITOR_INTERVAL = float(os.environ.get("SCRAPERS_LOOP_MONITOR_INTERVAL", 0.5))
+SCRAPERS_LOOP_BLOCK_THRESHOLD = float(os.environ.get("SCRAPERS_LOOP_BLOCK_THRESHOLD", 0.1))
+# Allocation lines reported for every stage of a profiled run, see cinemas.profiling
+SCRAPERS_PROFILE_TOP_ALLOCATIONS = int(os.environ.get("SCRAPERS_PROFILE_TOP_ALLOCATIONS", 10))
+# Export of the OpenTelemetry spans of the status requests and scraper runs: "otlp" sends them to the collector at
+# TRACING_OTLP_ENDPOINT, "file" appends them to TRACING_FILE as JSON lines, empty disables tracing
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "")
+TRACING_OTLP_ENDPOINT = os.environ.get("TRACING_OTLP_ENDPOINT", "http://otel-collector:4318/v1/traces")
+TRACING_FILE = os.environ.get("TRACING_FILE", "traces.jsonl")
+# Share of the traced status requests, the scraper runs started by them are traced together with them
+TRACING_SAMPLE_RATE = float(os.environ.get("TRACING_SAMPLE_RATE", 1))
+# Scrapers save local showtime times of the cinema providers in this time zone
+SHOWTIMES_TIME_ZONE = os.environ.get("SHOWTIMES_TIME_ZONE", "Asia/Dubai")
+# Maximum number of showtimes refreshed by one celery task
+SHOWTIMES_REFRESH_BATCH_SIZE = int(os.environ.get("SHOWTIMES_REFRESH_BATCH_SIZE", 100))
 
 CSRF_USE_SESSIONS = True
 CSRF_COOKIE_HTTPONLY = True
@@ -16,4 +16,11 @@ fi
 #python manage.py makemigrations
 python manage.py migrate
 
+# Metrics files of the processes of the previous container run are removed, see common.metrics
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]
+then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 exec "$@"
\ No newline at end of file
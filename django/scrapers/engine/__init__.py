@@ -0,0 +1,4 @@
+from common.metrics import timed_parser
+from scrapers.engine.base import BaseScraper, Movie
+from scrapers.engine.client import ScraperClient, ScraperRequestError
+from scrapers.engine.stats import ScraperStats
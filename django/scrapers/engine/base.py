@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import AsyncIterator, Awaitable, Dict, List, NamedTuple, Optional, TypeVar, Union
+from uuid import UUID
+
+import aiohttp
+from django.conf import settings
+from django.core.cache import cache
+
+from cinemas.discovery import DiscoveredShowtime
+from cinemas.models import ScraperTask
+from cinemas.models import Showtime as DjangoShowtime
+from cinemas.pipeline import RefreshResult, collect_refreshed, iter_refreshed, iter_stage, scrape_showtimes
+from cinemas.refresh import RefreshedSeats
+from cinemas.runstats import current_run_stats
+from cinemas.runtime import runtime
+from common.metrics import SCRAPER_STAGE_SECONDS
+from common.tracing import start_span
+from scrapers.engine.client import ScraperClient
+from scrapers.engine.limiter import RateLimiter
+from scrapers.engine.stats import ScraperStats
+
+T = TypeVar("T")
+
+HEADERS = {
+    "user-agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36",
+}
+
+
+class Movie(NamedTuple):
+    id: str
+    title: str
+    url: str = ""
+    language: str = ""
+
+
+class BaseScraper:
+    """
+    Scraper engine. A cinema provider implements only `list_movies`, `list_showtimes` and `fetch_seats`,
+    the engine schedules them with bounded concurrency and retries, caches the movies and saves the results.
+    """
+    name: str = ""
+    main_page: str = ""
+    country: str = "UAE"
+    headers: dict = HEADERS
+    # Maximum number of simultaneous requests to the cinema provider site
+    concurrency: int = 50
+    retries: int = 3
+    # Seconds before the first retry, doubled with every next retry
+    retry_delay: float = 5
+    request_timeout: int = 60
+    session_timeout: int = 3200
+    # Connections are kept alive between requests and runs of the worker, True closes them after every request
+    force_close: bool = False
+    # Seconds the resolved addresses of the site are cached
+    dns_cache_time: int = 60 * 5
+    # Seconds the list of movies is cached between runs, 0 disables the cache
+    movies_cache_time: int = 60 * 10
+    # Requests per second to one host from all celery workers together, None uses SCRAPERS_RATE_LIMIT
+    rate_limit: Optional[float] = None
+
+    def __init__(self):
+        # Level of every scraper is set by SCRAPERS_LOG_LEVELS, also for the records of the engine
+        self.logger = logging.getLogger(f"scrapers.{self.name}")
+        self.connector: Optional[aiohttp.TCPConnector] = None
+        self.connector_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.rate_limiter: Optional[RateLimiter] = None
+        self.rate_limiter_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def list_movies(self, client: ScraperClient) -> List[Movie]:
+        raise NotImplementedError
+
+    async def list_showtimes(self, client: ScraperClient, movie: Movie, date_query: date) -> List[DiscoveredShowtime]:
+        raise NotImplementedError
+
+    async def fetch_seats(self, client: ScraperClient, showtime: DjangoShowtime) -> Optional[List[RefreshedSeats]]:
+        raise NotImplementedError
+
+    async def prepare_client(self, client: ScraperClient):
+        """
+        Called once per run before any other request, e.g. to receive an authorization key
+        """
+
+    def check_response(self, text: str) -> bool:
+        """
+        Some sites answer errors with status 200, such responses are retried
+        """
+        return True
+
+    def new_connector(self) -> aiohttp.TCPConnector:
+        return aiohttp.TCPConnector(force_close=self.force_close, limit=self.concurrency,
+                                    ttl_dns_cache=self.dns_cache_time)
+
+    def get_connector(self) -> aiohttp.TCPConnector:
+        """
+        Connection pool shared by all runs of the scraper in the worker loop
+        """
+        if self.connector is None or self.connector.closed or self.connector_loop is not runtime.loop:
+            self.connector = self.new_connector()
+            self.connector_loop = runtime.loop
+            runtime.on_shutdown(self.connector.close)
+        return self.connector
+
+    def get_rate_limiter(self, shared: bool) -> Optional[RateLimiter]:
+        """
+        Rate limiter shared by all runs of the scraper in the worker loop, so the tokens taken from Redis in advance
+        by one run are used by the next runs instead of being lost
+        """
+        rate_limit = settings.SCRAPERS_RATE_LIMIT if self.rate_limit is None else self.rate_limit
+        if not rate_limit:
+            return None
+        if not shared:
+            return RateLimiter(rate_limit, settings.SCRAPERS_RATE_LIMIT_BURST, settings.SCRAPERS_RATE_LIMIT_PREFETCH)
+        if self.rate_limiter is None or self.rate_limiter_loop is not runtime.loop:
+            self.rate_limiter = RateLimiter(rate_limit, settings.SCRAPERS_RATE_LIMIT_BURST,
+                                            settings.SCRAPERS_RATE_LIMIT_PREFETCH)
+            self.rate_limiter_loop = runtime.loop
+        return self.rate_limiter
+
+    @asynccontextmanager
+    async def open_client(self) -> AsyncIterator[ScraperClient]:
+        stats = ScraperStats()
+        # Runs outside of the worker loop, e.g. asyncio.run in a shell, own their connections
+        shared = asyncio.get_running_loop() is runtime.loop
+        connector = self.get_connector() if shared else self.new_connector()
+        timeout = aiohttp.ClientTimeout(total=self.session_timeout)
+        # Every run has its own session, so cookies and headers set by a run do not leak into the next runs
+        async with aiohttp.ClientSession(connector=connector, connector_owner=not shared, headers=self.headers,
+                                         timeout=timeout) as session:
+            client = ScraperClient(
+                session,
+                # The concurrency limit belongs to the run, parallel runs of the worker do not share it
+                asyncio.Semaphore(self.concurrency),
+                stats,
+                self.retries,
+                self.retry_delay,
+                self.request_timeout,
+                self.check_response,
+                self.get_rate_limiter(shared),
+                self.logger
+            )
+            try:
+                await self.prepare_client(client)
+                yield client
+            finally:
+                self.logger.info(f"{self.name} run stats: {stats}", extra=stats.as_dict())
+                run_stats = current_run_stats.get()
+                if run_stats is not None:
+                    run_stats.add_requests(stats.statuses, stats.bytes, stats.retries)
+
+    async def timed_stage(self, stage: str, coro: Awaitable[T]) -> T:
+        started = time.monotonic()
+        try:
+            with start_span(stage, scraper=self.name):
+                return await coro
+        finally:
+            SCRAPER_STAGE_SECONDS.labels(self.name, stage).observe(time.monotonic() - started)
+
+    async def get_movies(self, client: ScraperClient) -> List[Movie]:
+        cache_key = f"scraper_movies:{self.name}"
+        if self.movies_cache_time:
+            movies = await cache.aget(cache_key)
+            if movies is not None:
+                return movies
+        movies = await self.timed_stage("list_movies", self.list_movies(client))
+        if self.movies_cache_time:
+            await cache.aset(cache_key, movies, self.movies_cache_time)
+        return movies
+
+    async def discover(self, dates: List[date]) -> Dict[date, List[DiscoveredShowtime]]:
+        async with self.open_client() as client:
+            movies = await self.get_movies(client)
+            client.stats.movies = len(movies)
+            self.logger.info(f"{self.name} received {len(movies)} movies")
+            # Pages shared by the dates of a movie are requested once, see ScraperClient.get_cached
+            movies_dates = [(movie, date_query) for movie in movies for date_query in dates]
+            movies_showtimes = {
+                movie_date: movie_showtimes
+                async for movie_date, movie_showtimes in iter_stage(
+                    movies_dates,
+                    lambda movie_date: self.timed_stage("list_showtimes", self.list_showtimes(client, *movie_date)),
+                    self.concurrency
+                )
+            }
+
+        dates_showtimes = {}
+        for date_query in dates:
+            showtimes = {}
+            # The same showtime of several movies is taken from the last one in the order of the movies
+            for movie in movies:
+                for showtime in movies_showtimes[(movie, date_query)]:
+                    showtimes[showtime.external_id] = showtime
+            self.logger.info(f"{self.name} received {len(showtimes)} showtimes for {date_query}")
+            dates_showtimes[date_query] = list(showtimes.values())
+        return dates_showtimes
+
+    async def fetch_all_seats(self, showtimes: List[DjangoShowtime]) -> AsyncIterator[RefreshResult]:
+        async with self.open_client() as client:
+            # A showtime needs at least one request, so more showtimes than requests at the same time are only waiting
+            async for showtime, seats in iter_refreshed(
+                showtimes,
+                lambda showtime: self.timed_stage("fetch_seats", self.fetch_seats(client, showtime)),
+                self.concurrency
+            ):
+                client.stats.showtimes += 1
+                if seats is None:
+                    client.stats.failed_showtimes += 1
+                yield showtime, seats
+
+    # The functions below are the scraper module interface used by cinemas.tasks
+
+    def discover_showtimes(self, dates: List[date]) -> Dict[date, List[DiscoveredShowtime]]:
+        return runtime.run(self.discover(dates))
+
+    def stream_showtimes(self, showtimes: List[DjangoShowtime]) -> AsyncIterator[RefreshResult]:
+        return self.fetch_all_seats(showtimes)
+
+    def refresh_showtimes(self, showtimes: List[DjangoShowtime]) -> Dict[UUID, Optional[List[RefreshedSeats]]]:
+        return runtime.run(collect_refreshed(self.fetch_all_seats(showtimes)))
+
+    def save_to_django_db(self, tasks: Union[ScraperTask, List[ScraperTask]]):
+        # Callers of the single date interface pass one task
+        if isinstance(tasks, ScraperTask):
+            tasks = [tasks]
+        for task in tasks:
+            self.logger.info(f"Start task for {task.cinema_provider.name} {task.date_query} {task.id}")
+        scrape_showtimes(tasks, self.discover_showtimes, self.stream_showtimes)
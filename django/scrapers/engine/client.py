@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional
+
+import aiohttp
+import yarl
+
+from common.logs import is_sampled
+from common.metrics import (
+    SCRAPER_HTTP_ERRORS, SCRAPER_HTTP_IN_FLIGHT, SCRAPER_HTTP_REQUEST_SECONDS, SCRAPER_HTTP_RETRIES, get_endpoint
+)
+from common.tracing import start_span
+from scrapers.engine.limiter import RateLimiter
+from scrapers.engine.stats import ScraperStats
+
+logger = logging.getLogger(__name__)
+
+
+# Client errors answered again on a retry are timeouts and rate limits only
+RETRY_STATUSES = {408, 425, 429}
+
+
+class ScraperRequestError(Exception):
+    pass
+
+
+def is_retryable(status: int) -> bool:
+    """
+    Server errors are retried, client errors like 404 of a removed showtime would fail the same way again
+    """
+    return status >= 500 or status in RETRY_STATUSES
+
+
+class ScraperClient:
+    """
+    HTTP client of one scraper run. All requests of the run share the concurrency limit, the retry policy
+    and the statistics, sessions opened with `isolated` additionally share the connection pool.
+    """
+
+    def __init__(self,
+                 session: aiohttp.ClientSession,
+                 semaphore: asyncio.Semaphore,
+                 stats: ScraperStats,
+                 retries: int,
+                 retry_delay: float,
+                 request_timeout: int,
+                 check_response: Callable[[str], bool],
+                 rate_limiter: Optional[RateLimiter] = None,
+                 run_logger: Optional[logging.Logger] = None):
+        self.session = session
+        self.semaphore = semaphore
+        self.stats = stats
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.request_timeout = request_timeout
+        self.check_response = check_response
+        self.rate_limiter = rate_limiter
+        self.logger = run_logger or logger
+        self.responses: Dict[tuple, asyncio.Future] = {}
+
+    @property
+    def headers(self):
+        return self.session.headers
+
+    async def request(self, method: str, url: str, **kwargs) -> str:
+        host = yarl.URL(url).host
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats.retries += 1
+                SCRAPER_HTTP_RETRIES.labels(host).inc()
+                # Exponential backoff with jitter, so that retries of many showtimes do not hit the site at once
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            # Every attempt is a span of the scraper stage, including the wait for the rate limit and the concurrency
+            attributes = {"http.method": method, "http.url": url, "attempt": attempt + 1}
+            with start_span(f"{method} {host}", **attributes) as span:
+                try:
+                    if self.rate_limiter:
+                        waited = await self.rate_limiter.acquire(host)
+                        if waited:
+                            self.stats.rate_limited += 1
+                            self.stats.rate_limit_wait += waited
+                    async with self.semaphore:
+                        self.stats.requests += 1
+                        if is_sampled(self.logger):
+                            self.logger.debug(f"Loading {method} {url}", extra={"request_kwargs": kwargs})
+                        started = time.monotonic()
+                        with SCRAPER_HTTP_IN_FLIGHT.labels(host).track_inprogress():
+                            async with self.session.request(method, url, timeout=self.request_timeout,
+                                                            **kwargs) as resp:
+                                self.stats.bytes += len(await resp.read())
+                                self.stats.add_status(str(resp.status))
+                                span.set_attribute("http.status_code", resp.status)
+                                text = await resp.text()
+                        duration = time.monotonic() - started
+                        SCRAPER_HTTP_REQUEST_SECONDS.labels(host, get_endpoint(url)).observe(duration)
+                        if resp.ok and self.check_response(text):
+                            return text
+                        SCRAPER_HTTP_ERRORS.labels(host, str(resp.status)).inc()
+                        self.logger.warning(f"Page failed to load. Url - {resp.url}. Status code - {resp.status}. "
+                                            f"Attempt {attempt + 1} of {self.retries + 1}")
+                        if not resp.ok and not is_retryable(resp.status):
+                            self.stats.failed_requests += 1
+                            raise ScraperRequestError(f"Page failed to load. Url - {url}. Status code - {resp.status}")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.stats.add_status(type(e).__name__)
+                    span.set_attribute("error", type(e).__name__)
+                    SCRAPER_HTTP_ERRORS.labels(host, type(e).__name__).inc()
+                    self.logger.warning(f"Page failed to load. Url - {url}. Error - {e!r}. "
+                                        f"Attempt {attempt + 1} of {self.retries + 1}")
+        self.stats.failed_requests += 1
+        raise ScraperRequestError(f"Page failed to load after {self.retries + 1} attempts. Url - {url}")
+
+    async def get(self, url: str, params: dict = None, **kwargs) -> str:
+        return await self.request("GET", url, params=params, **kwargs)
+
+    async def post(self, url: str, params: dict = None, data=None, json=None, **kwargs) -> str:
+        return await self.request("POST", url, params=params, data=data, json=json, **kwargs)
+
+    async def get_cached(self, url: str, params: dict = None) -> str:
+        """
+        GET request made once by the client, e.g. a movie page shared by the showtimes of all dates of the run
+        """
+        key = (url, tuple(sorted((params or {}).items())))
+        if key not in self.responses:
+            self.responses[key] = asyncio.ensure_future(self.get(url, params))
+        # A cancelled caller does not cancel the request awaited by the other callers
+        return await asyncio.shield(self.responses[key])
+
+    async def get_json(self, url: str, params: dict = None, **kwargs):
+        return json.loads(await self.get(url, params=params, **kwargs))
+
+    async def post_json(self, url: str, params: dict = None, data=None, json_data=None, **kwargs):
+        return json.loads(await self.post(url, params=params, data=data, json=json_data, **kwargs))
+
+    @asynccontextmanager
+    async def isolated(self, headers: Optional[dict] = None) -> AsyncIterator["ScraperClient"]:
+        """
+        Client with its own cookies for sites that keep the booking state of one showtime in the session
+        """
+        session = aiohttp.ClientSession(
+            connector=self.session.connector,
+            connector_owner=False,
+            headers=headers or self.session.headers,
+            timeout=self.session.timeout
+        )
+        async with session:
+            yield ScraperClient(
+                session,
+                self.semaphore,
+                self.stats,
+                self.retries,
+                self.retry_delay,
+                self.request_timeout,
+                self.check_response,
+                self.rate_limiter,
+                self.logger
+            )
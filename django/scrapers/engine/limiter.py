@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Tuple
+
+from common.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Token bucket of one host. Takes up to ARGV[3] tokens and returns the number of taken tokens
+# together with milliseconds until the next token if none is left
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate / 1000)
+local taken = math.min(requested, math.floor(tokens))
+tokens = tokens - taken
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+local wait = 0
+if taken == 0 then
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+return {taken, wait}
+"""
+
+
+def get_rate_limit_key(host: str) -> str:
+    return f"scraper_rate:{host}"
+
+
+class HostTokens:
+    """
+    Tokens of one host taken from Redis by this client in advance
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.taken_on = 0.0
+        self.lock = asyncio.Lock()
+
+
+class RateLimiter:
+    """
+    Requests per second to every host from all celery workers together. The token buckets are kept in Redis,
+    a worker takes `prefetch` tokens at once, so most requests do not need a round trip to Redis.
+    """
+
+    def __init__(self, rate: float, burst: int, prefetch: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.prefetch = max(min(prefetch, self.burst), 1)
+        # Tokens taken in advance are dropped after this time, otherwise they would exceed the rate later
+        self.tokens_lifetime = self.prefetch / rate
+        self.hosts: Dict[str, HostTokens] = {}
+
+    def take(self, host: str, count: int) -> Tuple[int, int]:
+        try:
+            taken, wait = get_redis().eval(TAKE_SCRIPT, 1, get_rate_limit_key(host), self.rate, self.burst, count)
+            return int(taken), int(wait)
+        except Exception as e:
+            # The scrapers keep working without Redis, only the limit is not applied
+            logger.warning(f"Rate limit of {host} is not applied, Redis error {e!r}")
+            return count, 0
+
+    async def acquire(self, host: str) -> float:
+        """
+        Waits for a token of the host and returns the waiting time in seconds
+        """
+        tokens = self.hosts.setdefault(host, HostTokens())
+        started = time.monotonic()
+        async with tokens.lock:
+            while True:
+                if tokens.count and time.monotonic() - tokens.taken_on <= self.tokens_lifetime:
+                    tokens.count -= 1
+                    return time.monotonic() - started
+                taken, wait = await asyncio.to_thread(self.take, host, self.prefetch)
+                tokens.count, tokens.taken_on = taken, time.monotonic()
+                if not taken:
+                    await asyncio.sleep(wait / 1000)
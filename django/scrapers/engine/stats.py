@@ -0,0 +1,47 @@
+import time
+from typing import Dict
+
+
+class ScraperStats:
+    """
+    Counters of one scraper run, logged when the run finishes
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.retries = 0
+        self.failed_requests = 0
+        self.movies = 0
+        self.showtimes = 0
+        self.failed_showtimes = 0
+        # Requests delayed by the rate limit and their total delay in seconds
+        self.rate_limited = 0
+        self.rate_limit_wait = 0.0
+        # Responses by the status or the error name, and the downloaded bytes
+        self.statuses: Dict[str, int] = {}
+        self.bytes = 0
+
+    def add_status(self, status: str):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    @property
+    def duration(self) -> float:
+        return time.monotonic() - self.started
+
+    def as_dict(self) -> dict:
+        return {
+            "duration": round(self.duration, 3),
+            "requests": self.requests,
+            "retries": self.retries,
+            "failed_requests": self.failed_requests,
+            "movies": self.movies,
+            "showtimes": self.showtimes,
+            "failed_showtimes": self.failed_showtimes,
+            "rate_limited": self.rate_limited,
+            "rate_limit_wait": round(self.rate_limit_wait, 3),
+            "bytes": self.bytes,
+        }
+
+    def __str__(self):
+        return ", ".join(f"{key} {value}" for key, value in self.as_dict().items())
@@ -1,19 +1,25 @@
-function waitAvailableStatus(cinema_id, name, date) {
+function waitAvailableStatus(pending) {
+  if ($.isEmptyObject(pending)) return;
+  const items = Object.values(pending).map((item) => ({cinema_id: item.cinema_id, date: item.date}))
   $.ajax({
-      url: '/get_scraper_status',
-      data: {
-        cinema_id: cinema_id,
-        date: date,
-      },
+      url: '/get_scraper_status_batch',
+      data: JSON.stringify({items: items}),
+      contentType: 'application/json',
       method: 'POST',
     })
     .done((res) => {
-      if (res.status === 'AVAILABLE') {
-        addLinkToCSV(cinema_id, name, res.task_id)
-        return true
-      }
+      res.results.forEach((result) => {
+        if (result.status === 'AVAILABLE') {
+          addLinkToCSV(result.cinema_id, pending[result.cinema_id].name, result.task_id, result.age)
+          delete pending[result.cinema_id]
+        } else if (result.status === 'QUEUED') {
+          addQueuedStatus(result.cinema_id, pending[result.cinema_id].name, result.position, result.wait)
+        } else if (result.status === 'PARTIAL') {
+          addPartialLinkToCSV(result.cinema_id, pending[result.cinema_id].name, result.task_id, result.saved, result.total)
+        }
+      })
       setTimeout(function() {
-        waitAvailableStatus(cinema_id, name, date);
+        waitAvailableStatus(pending);
       }, 1000);
     })
     .fail((err) => {
@@ -21,12 +27,38 @@ function waitAvailableStatus(cinema_id, name, date) {
     });
 }
 
-function addLinkToCSV(cinema_id, name, task_id) {
+function formatAge(age) {
+  if (age < 60) return "just now"
+  if (age < 60 * 60) return Math.floor(age / 60) + " min ago"
+  return Math.floor(age / (60 * 60)) + " h ago"
+}
+
+function addLinkToCSV(cinema_id, name, task_id, age) {
   $("li[name="+ cinema_id + "]").empty()
   const check_icon = ' <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" ' +
     'class="bi bi-check" viewBox="0 0 16 16"><path d="M10.97 4.97a.75.75 0 0 1 1.07 1.05l-3.99 4.99a.75.75 0 0 ' +
     '1-1.08.02L4.324 8.384a.75.75 0 1 1 1.06-1.06l2.094 2.093 3.473-4.425a.267.267 0 0 1 .02-.022z"/></svg>'
-  $("li[name="+ cinema_id + "]").prepend("<a href='/get_csv/" + task_id + "' target='_blank'>" + check_icon + name + "</a>")
+  $("li[name="+ cinema_id + "]").prepend("<a href='/get_csv/" + task_id + "' target='_blank'>" + check_icon + name + "</a>" +
+    " <small class='text-muted'>updated " + formatAge(age) + "</small>")
+}
+
+function addPartialLinkToCSV(cinema_id, name, task_id, saved, total) {
+  $("li[name="+ cinema_id + "]").empty()
+  const spinner = "<div class='spinner-border spinner-border-sm' role='status'><span class='visually-hidden'></span></div> "
+  $("li[name="+ cinema_id + "]").prepend(spinner + "<a href='/get_csv/" + task_id + "' target='_blank'>" + name + "</a>" +
+    " <small class='text-muted'>" + saved + " of " + total + " showtimes</small>")
+}
+
+function formatWait(wait) {
+  if (wait < 60) return "less than a minute"
+  return "about " + Math.ceil(wait / 60) + " min"
+}
+
+function addQueuedStatus(cinema_id, name, position, wait) {
+  $("li[name="+ cinema_id + "]").empty()
+  const spinner = "<div class='spinner-border spinner-border-sm' role='status'><span class='visually-hidden'></span></div> "
+  $("li[name="+ cinema_id + "]").prepend(spinner + name +
+    " <small class='text-muted'>#" + position + " in queue, " + formatWait(wait) + "</small>")
 }
 
 function addImgToInputLabel() {
@@ -58,6 +90,7 @@ $(document).ready(() => {
     let date_month = $('#id_date_month option:selected').val()
     let date_year = $('#id_date_year option:selected').val()
     let date_str = date_year + "-" + date_month + "-" + date_day
+    let pending = {}
 
     selected_cinemas.each(function() {
       let value = $(this).val()
@@ -67,7 +100,8 @@ $(document).ready(() => {
       const html = "<li name='"+ value +"' class='mt-1'><div class='spinner-border spinner-border-sm' role='status'>" +
         "<span class='visually-hidden'></span></div> " + name + "</li>"
       $("#results").prepend(html)
-      waitAvailableStatus(value, name, date_str)
+      pending[value] = {cinema_id: value, name: name, date: date_str}
     });
+    waitAvailableStatus(pending)
   });
 });
\ No newline at end of file